@@ -0,0 +1,102 @@
+# Copyright 2013-2024 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# Copyright 2024 ACCESS-NRI
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import hashlib
+import shutil
+
+import llnl.util.tty as tty
+
+from spack.package import *
+
+# Build helpers shared by the ACCESS-NRI model recipes, which import them with
+#   from spack.pkg.access.nri.access_build_utils import ...
+# The recipes do not depend on this package, it only holds the helpers.
+
+# The values of the opt_level variant shared by OASIS3-MCT and CICE.
+OPT_LEVELS = ("debug", "production", "aggressive")
+
+
+def target_flags(spec, legacy=""):
+    """
+    Return the architecture flags for the target and compiler of spec. The
+    released builds use a generic target (e.g. target=x86_64), for which
+    archspec only offers baseline flags, so generic targets keep the legacy
+    flags that the Intel builds were released with. The GCC builds had none.
+    """
+    if spec.compiler.name not in ("intel", "oneapi"):
+        legacy = ""
+    if spec.target.vendor == "generic":
+        return legacy
+    try:
+        return spec.architecture.target.optimization_flags(spec.compiler)
+    except ValueError as err:
+        # The compiler does not support, or does not know, the target.
+        tty.warn(f"No flags for target={spec.target} with {spec.compiler}: {err}")
+        return legacy
+
+
+def optimisation_flags(spec, opt_level, production=""):
+    """
+    Return the optimisation flags, without the architecture flags of
+    target_flags(), for opt_level and the target and compiler of spec.
+    production is what the released builds used, so that the default
+    production level leaves them unchanged.
+    """
+    if opt_level == "debug":
+        return "-O0 -g"
+    if opt_level == "production":
+        return production
+
+    flags = "-O3"
+    if spec.compiler.name not in ("intel", "oneapi"):
+        flags += " -funroll-loops"
+    elif spec.target.vendor != "generic" and "avx512f" in spec.target:
+        # Use the full width of the AVX-512 registers.
+        flags += " -qopt-zmm-usage=high"
+    return flags
+
+
+def sha256sum(path):
+    """Return the SHA-256 digest of the file at path."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def check_reproducible(pkg, artefacts, rebuild, exclude=()):
+    """
+    Check that the build of pkg is bitwise reproducible. artefacts maps each
+    installed file to the file that the build writes, relative to the source
+    directory. Copy the source directory, without the files and directories
+    matching the exclude patterns, rebuild the copy with rebuild(path), and
+    compare. The rebuild is in another directory so that it also catches the
+    stage path leaking into the artefacts.
+    """
+    installed = {path: sha256sum(path) for path in artefacts}
+    rebuild_path = join_path(pkg.stage.path, "spack-src-rebuild")
+    shutil.rmtree(rebuild_path, ignore_errors=True)
+    shutil.copytree(pkg.stage.source_path, rebuild_path, symlinks=True,
+                    ignore=shutil.ignore_patterns(*exclude))
+    rebuild(rebuild_path)
+    differ = []
+    for path, rebuilt in artefacts.items():
+        print(f"INFO: {installed[path]}  {path}")
+        if sha256sum(join_path(rebuild_path, rebuilt)) != installed[path]:
+            differ.append(path)
+    if differ:
+        raise InstallError("Rebuild is not bitwise identical: " + " ".join(differ))
+
+
+class AccessBuildUtils(BundlePackage):
+    """Build helpers shared by the ACCESS-NRI model recipes. There is nothing to install."""
+
+    homepage = "https://www.access-nri.org.au"
+
+    maintainers("harshula")
+
+    version("latest")
+
+    # There is no need for install() since there is no code.
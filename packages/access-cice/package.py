@@ -36,6 +36,14 @@ class AccessCice(CMakePackage):
         description="CICE IO Method"
     )
 
+    # The iotype is selected at run time with history_format and restart_format.
+    variant(
+        "pnetcdf",
+        default=False,
+        description="Build PIO with PnetCDF and parallel netCDF-4 support",
+        when="io_type=PIO"
+    )
+
     variant("driver",
             default="none",
             values=("none", "nuopc/cmeps", "access/cmeps", "standalone/cice"),
@@ -47,6 +55,8 @@ class AccessCice(CMakePackage):
     depends_on("mpi")
     depends_on("netcdf-fortran@4.6.0:", when="io_type=NetCDF")
     depends_on("parallelio@2.5.3:", when="io_type=PIO")
+    depends_on("parallelio+pnetcdf", when="+pnetcdf")
+    depends_on("netcdf-c+mpi", when="+pnetcdf")
 
     root_cmakelists_dir = "configuration/scripts/cmake"
 
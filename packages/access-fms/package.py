@@ -36,6 +36,8 @@ class AccessFms(CMakePackage):
     variant("shared", default=False, description="Build shared/dynamic libraries")
     # To build a shared/dynamic library, both `pic` and `shared` are required:
     requires("+pic", when="+shared", msg="The +shared variant requires +pic")
+    variant("openmp", default=False, description="Build with OpenMP support")
+    variant("ipo", default=False, description="Interprocedural (link-time) optimisation")
 
     depends_on("netcdf-c")
     depends_on("netcdf-fortran")
@@ -67,6 +69,10 @@ class AccessFms(CMakePackage):
             self.define_from_variant("INTERNAL_FILE_NML"),
             self.define_from_variant("FPIC", "pic"),
             self.define_from_variant("SHARED_LIBS", "shared"),
+            self.define_from_variant("OPENMP", "openmp"),
+            self.define_from_variant("CMAKE_INTERPROCEDURAL_OPTIMIZATION", "ipo"),
+            # Honour CMAKE_INTERPROCEDURAL_OPTIMIZATION whatever the cmake_minimum_required.
+            self.define("CMAKE_POLICY_DEFAULT_CMP0069", "NEW"),
         ]
 
         return args
@@ -34,6 +34,8 @@ class AccessGenericTracers(CMakePackage):
         default=False,
         description="Build shared/dynamic libraries"
     )
+    variant("openmp", default=False, description="Build with OpenMP support")
+    variant("ipo", default=False, description="Interprocedural (link-time) optimisation")
     # NOTE: access-fms@mom5 should be used in OM2, ESM1.5 and ESM1.6 to preserve
     # answers with previous releases
     variant(
@@ -47,12 +49,21 @@ class AccessGenericTracers(CMakePackage):
     # TODO: Make conditional once Spack v0.23 or newer is used. The newer
     #       versions contain an fms SPR with variant shared.
     depends_on("fms@2025.02:", when="~use_access_fms")
+    # The libraries linked into the same executable must agree on IPO.
     with when("+shared"):
         depends_on("access-mocsy+shared")
+        depends_on("access-mocsy+ipo", when="+ipo")
+        depends_on("access-mocsy~ipo", when="~ipo")
         depends_on("access-fms+shared", when="+use_access_fms")
     with when("~shared"):
         depends_on("access-mocsy")
+        # access-mocsy only has the ipo variant when built with CMake.
+        depends_on("access-mocsy+ipo", when="+ipo ^access-mocsy build_system=cmake")
+        depends_on("access-mocsy~ipo", when="~ipo ^access-mocsy build_system=cmake")
         depends_on("access-fms", when="+use_access_fms")
+    depends_on("access-fms+openmp", when="+openmp+use_access_fms")
+    depends_on("access-fms+ipo", when="+ipo+use_access_fms")
+    depends_on("access-fms~ipo", when="~ipo+use_access_fms")
 
     # TODO: We should try to remove this. The responsibility for including
     #       internal library dependencies for linking purposes should
@@ -70,4 +81,13 @@ class AccessGenericTracers(CMakePackage):
         return libraries + self.spec["access-mocsy"].libs
 
     def cmake_args(self):
-        return [self.define_from_variant("BUILD_SHARED_LIBS", "shared")]
+        args = [
+            self.define_from_variant("BUILD_SHARED_LIBS", "shared"),
+            self.define_from_variant("CMAKE_INTERPROCEDURAL_OPTIMIZATION", "ipo"),
+            self.define("CMAKE_POLICY_DEFAULT_CMP0069", "NEW"),
+        ]
+        # The generic tracers have no OpenMP directives, but are called from
+        # threaded regions of the ocean model, so compile them thread-safe.
+        if self.spec.satisfies("+openmp"):
+            args.append(self.define("CMAKE_Fortran_FLAGS", self.compiler.openmp_flag))
+        return args
@@ -44,6 +44,7 @@ class AccessMocsy(CMakePackage, MakefilePackage):
             description="CMake build type",
             values=("Debug", "Release", "RelWithDebInfo", "MinSizeRel"),
         )
+        variant("ipo", default=False, description="Interprocedural (link-time) optimisation")
         variant(
             "precision",
             default="2",
@@ -60,6 +61,8 @@ class CMakeBuilder(cmake.CMakeBuilder):
         args = [
             self.define_from_variant("BUILD_SHARED_LIBS", "shared"),
             self.define_from_variant("MOCSY_PRECISION", "precision"),
+            self.define_from_variant("CMAKE_INTERPROCEDURAL_OPTIMIZATION", "ipo"),
+            self.define("CMAKE_POLICY_DEFAULT_CMP0069", "NEW"),
         ]
         return args
 
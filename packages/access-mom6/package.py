@@ -2,8 +2,17 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import re
+
 from spack.package import *
 
+# A static memory build is grid:layout[:halo], e.g. 1440x1080x75:48x40 or 360x300x75:24x15:4
+_static_re = re.compile(r"^(\d+)x(\d+)x(\d+):(\d+)x(\d+)(?::(\d+))?$")
+
+
+def valid_static(value):
+    return value == "none" or _static_re.match(value) is not None
+
 
 class AccessMom6(CMakePackage):
     """The Modular Ocean Model (MOM) describes the numerical ocean models
@@ -35,6 +44,13 @@ class AccessMom6(CMakePackage):
         default=True,
         description="Install MOM6 as library for Access3 models"
     )
+    # The LAYOUT (and NIHALO/NJHALO) in MOM_input must match the build.
+    variant(
+        "static",
+        default="none",
+        values=valid_static,
+        description="Static memory build for the grid:layout[:halo], e.g. 1440x1080x75:48x40"
+    )
 
     depends_on("access3-share", when="+access3")
     depends_on("cmake@3.18:", type="build")
@@ -45,6 +61,34 @@ class AccessMom6(CMakePackage):
     depends_on("fms ~openmp", when="~openmp")
     depends_on("access-generic-tracers ~use_access_fms", when="@2025.02.001:")
 
+    def patch(self):
+        if self.spec.variants["static"].value == "none":
+            return
+
+        ni, nj, nk, npx, npy, halo = _static_re.match(self.spec.variants["static"].value).groups()
+        halo = halo or "4"
+        symmetric = "" if self.spec.satisfies("+asymmetric_mem") else "#define SYMMETRIC_MEMORY_\n"
+        memory = "dynamic_nonsymmetric" if self.spec.satisfies("+asymmetric_mem") else "dynamic_symmetric"
+
+        # Replace the header of the memory mode selected by MOM6_ASYMMETRIC
+        # with the static memory settings. See MOM_memory_macros.h.
+        with open(join_path("config_src", "memory", memory, "MOM_memory.h"), "w") as f:
+            f.write(
+                f"""!/// \\file MOM_memory.h
+!/// Static memory settings generated by Spack for {self.spec.variants["static"].value}
+#define NIGLOBAL_ {ni}
+#define NJGLOBAL_ {nj}
+#define NK_ {nk}
+{symmetric}#define STATIC_MEMORY_
+#define NIPROC_ {npx}
+#define NJPROC_ {npy}
+#define MAX_FIELDS_ 50
+#define NIHALO_ {halo}
+#define NJHALO_ {halo}
+
+#include <MOM_memory_macros.h>
+"""
+            )
 
     def cmake_args(self):
         args = [
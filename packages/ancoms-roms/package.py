@@ -147,7 +147,11 @@ class AncomsRoms(MakefilePackage):
         env.set("HDF5_LIBDIR", spec["hdf5"].prefix.libs)
 
     def build(self, spec, prefix):
-        make(parallel=False)
+        # Generate the module dependencies (MakeDepend in SCRATCH_DIR) with
+        # sfmakedepend first, so that the parallel build compiles the
+        # Fortran modules in dependency order.
+        make("depend", parallel=False)
+        make()
 
     def install(self, spec, prefix):
         mkdirp(prefix.bin)
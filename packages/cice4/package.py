@@ -5,6 +5,11 @@
 # Based on packages/cice5/package.py and other sources noted below.
 
 from spack.package import *
+from spack.pkg.access.nri.access_build_utils import (
+    OPT_LEVELS,
+    optimisation_flags,
+    target_flags,
+)
 
 
 # https://spack.readthedocs.io/en/latest/build_systems/makefilepackage.html
@@ -29,6 +34,13 @@ class Cice4(MakefilePackage):
         multi=False,
         description="Directly inject LDFLAGS into the Makefile",
      )
+    variant(
+        "opt_level",
+        default="production",
+        values=OPT_LEVELS,
+        multi=False,
+        description="Optimisation level, tuned to the target and compiler.",
+    )
 
     depends_on("netcdf-fortran@4.5.1:")
     depends_on("openmpi")
@@ -78,7 +90,13 @@ class Cice4(MakefilePackage):
         ldeps = ["oasis3-mct", "netcdf-fortran"]
         libs = " ".join([lstr] + [self.get_linker_args(spec, d) for d in ldeps])
 
-        CFLAGS = "-c -O2"
+        # The released Intel builds used -xCORE-AVX512, and -xCORE-AVX2 with DEBUG
+        OPT_LEVEL = spec.variants["opt_level"].value
+        OPT_FFLAGS = f"{optimisation_flags(spec, OPT_LEVEL)} {target_flags(spec)}".strip()
+        INTEL_OPT_FLAGS = optimisation_flags(spec, OPT_LEVEL, "-O2")
+        INTEL_TARGET_FLAGS = target_flags(spec, "-xCORE-AVX512")
+        TARGET_FLAGS = target_flags(spec, "-xCORE-AVX2")
+        CFLAGS = f"-c {optimisation_flags(spec, OPT_LEVEL, '-O2')} {target_flags(spec)}".strip()
         LDFLAGS = self.get_variant_value(spec.variants["direct_ldflags"].value)
 
         # Based on https://github.com/coecms/access-esm-build-gadi/blob/master/patch/Macros.Linux.raijin.nci.org.au-mct
@@ -99,16 +117,16 @@ FREEFLAGS  :=
         # based on packages/cice5/package.py (FFLAGS)
         # and  https://github.com/coecms/access-esm-build-gadi/blob/master/patch/Macros.Linux.raijin.nci.org.au-mct (LDFLAGS)
         config["gcc"] = f"""
-FFLAGS = -Wall -fdefault-real-8 -fdefault-double-8 -ffpe-trap=invalid,zero,overflow -fallow-argument-mismatch
+FFLAGS = -Wall -fdefault-real-8 -fdefault-double-8 -ffpe-trap=invalid,zero,overflow -fallow-argument-mismatch {OPT_FFLAGS}
 LDFLAGS    := $(FFLAGS) {LDFLAGS}
 """
 
         # Based on https://github.com/coecms/access-esm-build-gadi/blob/master/patch/Macros.Linux.raijin.nci.org.au-mct
         config["intel"] = f"""
 ifeq ($(DEBUG), yes)
-    FFLAGS     := -r8 -i4 -O0 -g -align all -w -ftz -convert big_endian -assume byterecl -no-vec -xCORE-AVX2 -fp-model precise
+    FFLAGS     := -r8 -i4 -O0 -g -align all -w -ftz -convert big_endian -assume byterecl -no-vec {TARGET_FLAGS} -fp-model precise
 else
-    FFLAGS     := -r8 -i4 -O2 -align all -w -ftz -convert big_endian -assume byterecl -no-vec -xCORE-AVX512 -fp-model precise
+    FFLAGS     := -r8 -i4 {INTEL_OPT_FLAGS} -align all -w -ftz -convert big_endian -assume byterecl -no-vec {INTEL_TARGET_FLAGS} -fp-model precise
 endif
 LDFLAGS    := $(FFLAGS) -v -static-intel {LDFLAGS}
 """
@@ -162,6 +180,7 @@ endif
         build = Executable(
                     join_path(self.stage.source_path, self._buildscript_path)
                 )
+        build.add_default_env("MAKE_JOBS", str(make_jobs))
 
         for k in self.__targets:
             build(self.__targets[k]["driver"],
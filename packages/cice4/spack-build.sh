@@ -73,7 +73,7 @@ setenv BLCKY `expr $NYGLOB / $NYBLOCK` # y-dimension of blocks (  ghost cells  )
 @ m = $a / $b ; setenv MXBLCKS $m ; if ($MXBLCKS == 0) setenv MXBLCKS 1
 echo Automatically generated: MXBLCKS = $MXBLCKS
 
-cp -f $CBLD/Makefile.std $CBLD/Makefile
+cmp -s $CBLD/Makefile.std $CBLD/Makefile || cp -f $CBLD/Makefile.std $CBLD/Makefile
 
 if ($NTASK == 1) then
    setenv COMMDIR serial
@@ -101,9 +101,19 @@ $SRCDIR/$COMMDIR
 $SRCDIR/$SHRDIR
 EOF
 
-cc -o makdep $CBLD/makdep.c || exit 2
+### Compile the dependency generator once and share it between targets.
+### Compile to a temporary name so that concurrent builds do not race.
+if !(-x $CBLD/makdep) then
+  cc -o $CBLD/makdep.$$ $CBLD/makdep.c || exit 2
+  mv -f $CBLD/makdep.$$ $CBLD/makdep
+endif
+ln -sf $CBLD/makdep makdep
+
+### The dependencies generated by makdep order the Fortran modules,
+### so make can run in parallel. MAKE_JOBS is set by Spack.
+if !($?MAKE_JOBS) setenv MAKE_JOBS 1
 
-make VPFILE=Filepath EXEC=$EXE \
+make -j $MAKE_JOBS VPFILE=Filepath EXEC=$EXE \
            NXGLOB=$NXGLOB NYGLOB=$NYGLOB \
            N_ILYR=$N_ILYR \
            BLCKX=$BLCKX BLCKY=$BLCKY MXBLCKS=$MXBLCKS \
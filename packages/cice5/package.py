@@ -2,7 +2,79 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import math
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
 from spack.package import *
+from spack.pkg.access.nri.access_build_utils import (
+    OPT_LEVELS,
+    check_reproducible,
+    optimisation_flags,
+    target_flags,
+)
+
+# A layout is grid:blocks:ntask[:mxblcks], e.g. 1440x1080:48x40:480
+_layout_re = re.compile(r"^(\d+x\d+):(\d+x\d+):(\d+)(?::(\d+))?$")
+
+
+def valid_layout(value):
+    return value == "none" or _layout_re.match(value) is not None
+
+
+def propose_decomposition(grid, ntask, ocean_mask=None, max_blocks_per_task=64):
+    """Propose the blocks and MXBLCKS of a CICE5 layout of grid over ntask ranks.
+
+    grid is "NXxNY". ocean_mask is a sequence of NY rows of NX values that are
+    true for ocean points (e.g. kmt > 0), or None for an all-ocean grid. CICE
+    does not distribute land-only blocks, so the proposal minimises the largest
+    number of cells per rank, counting the halo of each block. This favours
+    decompositions that leave more land-only blocks and less halo perimeter.
+    Only block counts that divide the grid evenly are considered, as required
+    by spack-build.sh.
+
+    For example:
+        spack python -c "from spack.pkg.access.nri.cice5 import propose_decomposition; print(propose_decomposition('360x300', 24))"
+    """
+    nx, ny = (int(n) for n in grid.split("x"))
+
+    # Prefix sums of the ocean points, so that each block is counted in O(1)
+    ocean = [[0] * (nx + 1) for _ in range(ny + 1)]
+    for j in range(ny):
+        row = ocean_mask[j] if ocean_mask is not None else None
+        running = 0
+        above = ocean[j]
+        below = ocean[j + 1]
+        for i in range(nx):
+            running += 1 if row is None or row[i] else 0
+            below[i + 1] = above[i + 1] + running
+
+    best = None
+    for nbx in (d for d in range(1, nx + 1) if nx % d == 0):
+        for nby in (d for d in range(1, ny + 1) if ny % d == 0):
+            if not ntask <= nbx * nby <= ntask * max_blocks_per_task:
+                continue
+            bx, by = nx // nbx, ny // nby
+            ocean_blocks = sum(
+                1
+                for jb in range(nby)
+                for ib in range(nbx)
+                if ocean[(jb + 1) * by][(ib + 1) * bx] - ocean[jb * by][(ib + 1) * bx]
+                - ocean[(jb + 1) * by][ib * bx] + ocean[jb * by][ib * bx] > 0
+            )
+            if ocean_blocks < ntask:
+                continue
+            mxblcks = math.ceil(ocean_blocks / ntask)
+            # Cells per rank, including a one-cell halo around each block
+            cost = (mxblcks * (bx + 2) * (by + 2), mxblcks)
+            if best is None or cost < best[0]:
+                best = (cost, f"{nbx}x{nby}", mxblcks)
+
+    if best is None:
+        raise ValueError(f"No decomposition of {grid} over {ntask} ranks")
+    return best[1], best[2]
 
 class Cice5(MakefilePackage):
     """The Los Alamos sea ice model (CICE) is the result of an effort to develop a computationally efficient sea ice component for a fully coupled atmosphere-land global climate model."""
@@ -37,6 +109,8 @@ class Cice5(MakefilePackage):
     )
 
     variant("deterministic", default=False, description="Deterministic build.")
+    variant("reproducible", default=False, description="Reproducible optimised build.")
+    conflicts("+deterministic", when="+reproducible", msg="+reproducible replaces +deterministic")
     # Support -fuse-ld=lld
     # https://github.com/ACCESS-NRI/spack-packages/issues/255
     variant(
@@ -47,6 +121,38 @@ class Cice5(MakefilePackage):
         description="Directly inject LDFLAGS into the Makefile",
      )
     variant("optimisation_report", default=False, description="Generate optimisation reports.")
+    variant(
+        "opt_level",
+        default="production",
+        values=OPT_LEVELS,
+        multi=False,
+        description="Optimisation level, tuned to the target and compiler.",
+    )
+    # Measure the cost of the barriers with cice5-gather-scatter-bench
+    variant(
+        "barriers",
+        default=True,
+        description="Add MPI barriers around global gathers and scatters (-Dgather_scatter_barrier)"
+    )
+    variant(
+        "gather_scatter_bench",
+        default=False,
+        description="Build and install cice5-gather-scatter-bench, to measure the cost of the barriers"
+    )
+    # Each layout adds a target, e.g. layouts=1440x1080:48x40:480,1440x1080:60x54:960:4
+    # See propose_decomposition() to choose the blocks and MXBLCKS of a layout.
+    variant(
+        "layouts",
+        default="none",
+        values=valid_layout,
+        multi=True,
+        description="Layouts grid:blocks:ntask[:mxblcks] replacing the default targets"
+    )
+    variant(
+        "openmp",
+        default=False,
+        description="Build with OpenMP threading, and add hybrid MPI x thread targets"
+    )
 
     # Depend on virtual package "mpi".
     depends_on("mpi")
@@ -55,23 +161,45 @@ class Cice5(MakefilePackage):
     depends_on("datetime-fortran")
     depends_on("oasis3-mct+deterministic", when="+deterministic")
     depends_on("oasis3-mct~deterministic", when="~deterministic")
+    depends_on("oasis3-mct+reproducible", when="+reproducible")
 
     with when("model=access-om2"):
+        # The PIO iotype (PnetCDF or parallel netCDF-4) is selected at run
+        # time in the namelist.
+        variant(
+            "pnetcdf",
+            default=False,
+            description="Build with a shared PIO with PnetCDF and parallel netCDF-4 iotypes"
+        )
+        depends_on("parallelio+pnetcdf~timing+shared", when="+pnetcdf")
+        depends_on("netcdf-c+mpi", when="+pnetcdf")
         # TODO: For initial verification we are going to use static pio.
         #       Eventually we plan to move to shared pio
         # ~shared requires: https://github.com/spack/spack/pull/34837
-        depends_on("parallelio~pnetcdf~timing~shared")
+        depends_on("parallelio~pnetcdf~timing~shared", when="~pnetcdf")
         depends_on("libaccessom2+deterministic", when="+deterministic")
         depends_on("libaccessom2~deterministic", when="~deterministic")
+        depends_on("libaccessom2+reproducible", when="+reproducible")
 
     phases = ["set_deps_targets", "edit", "build", "install"]
 
     __buildscript = "spack-build.sh"
+    __bench = "gather_scatter_bench.F90"
+    __bench_exe = "cice5-gather-scatter-bench"
     __buildscript_path = join_path("bld", __buildscript)
+    # The directory that is built, other than the stage by check_reproducible()
+    __srcdir = None
 
     __deps = {"includes": "", "ldflags": ""}
     __targets = {}
 
+    # The CPP macros that set the grid size and decomposition of a target.
+    __grid_macros = ("NXGLOB", "NYGLOB", "BLCKX", "BLCKY", "MXBLCKS")
+
+    # The number of OpenMP threads per rank of the hybrid targets
+    __openmp_threads = 2
+    __source_exts = (".F90", ".F", ".f90", ".f", ".c")
+
     def url_for_version(self, version):
         return "https://github.com/ACCESS-NRI/cice5/tarball/{0}".format(version)
 
@@ -98,10 +226,47 @@ class Cice5(MakefilePackage):
                     "-Wl,-rpath=" + path]
                    )
 
-    def add_target(self, ntask, driver, grid, blocks):
+    def add_target(self, ntask, driver, grid, blocks, mxblcks=None):
         self.__targets[ntask]["driver"] = driver
         self.__targets[ntask]["grid"] = grid
         self.__targets[ntask]["blocks"] = blocks
+        self.__targets[ntask]["mxblcks"] = mxblcks
+
+    # Replace the default targets with the layouts variant, if set
+    def add_layout_targets(self, driver):
+        layouts = [v for v in self.spec.variants["layouts"].value if v != "none"]
+        if not layouts:
+            return
+        self.__targets = {}
+        for layout in layouts:
+            grid, blocks, ntask, mxblcks = _layout_re.match(layout).groups()
+            ntask = int(ntask)
+            if ntask in self.__targets:
+                raise InstallError(f"layouts: more than one layout with {ntask} ranks")
+            self.__targets[ntask] = {}
+            self.add_target(ntask, driver, grid, blocks, mxblcks)
+
+    # The MXBLCKS of a target: its own, or as computed by spack-build.sh
+    def target_mxblcks(self, ntask):
+        target = self.__targets[ntask]
+        if target["mxblcks"]:
+            return int(target["mxblcks"])
+        nx, ny = (int(n) for n in target["grid"].split("x"))
+        nbx, nby = (int(n) for n in target["blocks"].split("x"))
+        return max(1, (nx * ny) // ((nx // nbx) * (ny // nby) * ntask))
+
+    # Add a hybrid target for each MPI target, with the same grid and blocks
+    # but __openmp_threads times fewer ranks, each threading over its blocks.
+    # Each rank then holds __openmp_threads times the MXBLCKS of the MPI target,
+    # which may be more than spack-build.sh would compute for the hybrid target.
+    def add_hybrid_targets(self):
+        for ntask, target in list(self.__targets.items()):
+            hybrid = ntask // self.__openmp_threads
+            if ntask % self.__openmp_threads == 0 and hybrid > 1 and hybrid not in self.__targets:
+                mxblcks = self.target_mxblcks(ntask) * self.__openmp_threads
+                self.__targets[hybrid] = {}
+                self.add_target(
+                    hybrid, target["driver"], target["grid"], target["blocks"], str(mxblcks))
 
     def set_deps_targets(self, spec, prefix):
 
@@ -117,12 +282,13 @@ class Cice5(MakefilePackage):
             # NOTE: The order of the libraries matter during the linking step!
             ldeps = ["oasis3-mct", "netcdf-c", "netcdf-fortran"]
             lstr = ""
+            self.add_layout_targets("access-esm1.6")
 
         else:  # model==access-om2
             # The integer represents environment variable NTASK
             self.__targets = {24: {}, 480: {}, 722: {}, 1682: {}}
 
-            # TODO: Each of these targets could map to a variant:
+            # The default targets, unless the layouts variant is set:
             self.add_target(24, "auscom", "360x300", "24x1")
             self.add_target(480, "auscom", "1440x1080", "48x40")
 
@@ -142,6 +308,10 @@ class Cice5(MakefilePackage):
             # NOTE: datetime-fortran is a dependency of libaccessom2.
             ldeps = ["oasis3-mct", "libaccessom2", "netcdf-c", "netcdf-fortran", "datetime-fortran"]
             lstr = self.make_linker_args(spec, "parallelio", "-lpiof -lpioc")
+            self.add_layout_targets("auscom")
+
+        if "+openmp" in spec:
+            self.add_hybrid_targets()
 
         istr = join_path((spec["oasis3-mct"].headers).cpp_flags, "psmile.MPI1")
         self.__deps["includes"] = " ".join([istr] + [(spec[d].headers).cpp_flags for d in ideps])
@@ -162,12 +332,22 @@ class Cice5(MakefilePackage):
         libs = self.__deps["ldflags"]
 
         # TODO: https://github.com/ACCESS-NRI/ACCESS-OM/issues/12
-        NCI_OPTIM_FLAGS = "-g3 -O2 -axCORE-AVX2 -debug all -check none -traceback -assume buffered_io"
-        CFLAGS = "-c -O2"
+        OPT_LEVEL = spec.variants["opt_level"].value
+        NCI_OPTIM_FLAGS = (
+            f"-g3 {optimisation_flags(spec, OPT_LEVEL, '-O2')} {target_flags(spec, '-axCORE-AVX2')} "
+            "-debug all -check none -traceback -assume buffered_io"
+        )
+        # The released GCC builds left the Fortran optimisation to the compiler.
+        OPT_FFLAGS = f"{optimisation_flags(spec, OPT_LEVEL)} {target_flags(spec)}".strip()
+        CFLAGS = f"-c {optimisation_flags(spec, OPT_LEVEL, '-O2')} {target_flags(spec)}".strip()
         LDFLAGS = self.get_variant_value(spec.variants["direct_ldflags"].value)
         if "+deterministic" in self.spec:
-            NCI_OPTIM_FLAGS = "-g0 -O0 -axCORE-AVX2 -debug none -check none -assume buffered_io"
+            NCI_OPTIM_FLAGS = f"-g0 -O0 {target_flags(spec, '-axCORE-AVX2')} -debug none -check none -assume buffered_io"
             CFLAGS = "-c -g0"
+        if "+reproducible" in self.spec:
+            NCI_OPTIM_FLAGS = f"-g0 -O2 {target_flags(spec, '-axCORE-AVX2')} -debug none -check none -assume buffered_io"
+            OPT_FFLAGS = f"-g0 -O2 {target_flags(spec)}".strip()
+            CFLAGS = f"-c -g0 -O2 {target_flags(spec)}".strip()
 
         if "+optimisation_report" in self.spec:
             NCI_OPTIM_FLAGS += " -qopt-report=5 -qopt-report-annotate"
@@ -187,9 +367,9 @@ FIXEDFLAGS := -132
 FREEFLAGS  :=
 """
 
-        config["gcc"] = """
+        config["gcc"] = f"""
 # TODO: removed -std=f2008 due to compiler errors
-FFLAGS = -Wall -fdefault-real-8 -fdefault-double-8 -ffpe-trap=invalid,zero,overflow -fallow-argument-mismatch
+FFLAGS = -Wall -fdefault-real-8 -fdefault-double-8 -ffpe-trap=invalid,zero,overflow -fallow-argument-mismatch {OPT_FFLAGS}
 """
 
         # module load intel-compiler/2019.5.281
@@ -211,6 +391,10 @@ endif
 
         # Copied from bld/Macros.nci
         config["post"] = f"""
+ifeq ($(THRD), yes)
+   FFLAGS  := $(FFLAGS) {self.compiler.openmp_flag}
+endif
+
 MOD_SUFFIX := mod
 LD         := $(FC)
 LDFLAGS    := $(FFLAGS) -v {LDFLAGS}
@@ -277,25 +461,170 @@ endif
         with open(makeinc_path, "w") as makeinc:
             makeinc.write(fullconfig)
 
+    def target_name(self, ntask):
+        return "_".join([self.__targets[ntask]["driver"],
+                            self.__targets[ntask]["grid"],
+                            self.__targets[ntask]["blocks"],
+                            str(ntask) + "p"])
+
+    def source_dir(self):
+        return self.__srcdir or self.stage.source_path
+
+    def target_objdir(self, ntask):
+        return join_path(self.source_dir(), "build_" + self.target_name(ntask))
+
+    # The source directories of a target, as listed in Filepath by spack-build.sh
+    def target_srcdirs(self, ntask):
+        driver = self.__targets[ntask]["driver"]
+        if driver == "access-esm1.6":
+            drvdir, iodir = "access", "io_netcdf"
+        else:
+            drvdir, iodir = driver, "io_pio"
+        commdir = "serial" if ntask == 1 else "mpi"
+        return [join_path(self.source_dir(), d)
+                for d in [join_path("drivers", drvdir), "source", commdir, iodir, "csm_share"]]
+
+    # Return the basenames of the sources, and the modules they define, whose
+    # objects do not depend on the grid size or decomposition macros, either
+    # directly or through the modules they use.
+    def grid_independent_sources(self, srcdirs):
+        sources = {}
+        for srcdir in srcdirs:
+            if not os.path.isdir(srcdir):
+                continue
+            for f in sorted(os.listdir(srcdir)):
+                base, ext = os.path.splitext(f)
+                # The first directory in Filepath takes precedence
+                if ext in self.__source_exts and base not in sources:
+                    sources[base] = join_path(srcdir, f)
+
+        macro_re = re.compile(r"\b(" + "|".join(self.__grid_macros) + r")\b")
+        module_re = re.compile(r"^\s*module\s+(\w+)\s*(?:!.*)?$", re.IGNORECASE | re.MULTILINE)
+        use_re = re.compile(r"^\s*use\s*(?:,\s*\w+\s*::)?\s*(\w+)", re.IGNORECASE | re.MULTILINE)
+        include_re = re.compile(r"^\s*#?\s*include\s+[\"'<]([^\"'>]+)[\"'>]", re.IGNORECASE | re.MULTILINE)
+
+        dependent = set()
+        modules = {}
+        uses = {}
+        for base, path in sources.items():
+            with open(path, errors="replace") as f:
+                text = f.read()
+            for inc in include_re.findall(text):
+                for srcdir in srcdirs:
+                    inc_path = join_path(srcdir, inc)
+                    if os.path.isfile(inc_path):
+                        with open(inc_path, errors="replace") as f:
+                            text += f.read()
+                        break
+            if macro_re.search(text):
+                dependent.add(base)
+            modules[base] = {m.lower() for m in module_re.findall(text)}
+            uses[base] = {u.lower() for u in use_re.findall(text)}
+
+        owners = {m: base for base in modules for m in modules[base]}
+        changed = True
+        while changed:
+            changed = False
+            for base in sources:
+                if base not in dependent and any(
+                        owners.get(u) in dependent for u in uses[base]):
+                    dependent.add(base)
+                    changed = True
+
+        return {base: modules[base] for base in sources if base not in dependent}
+
+    # Copy the grid-independent objects, modules and dependency files of the
+    # seed target into the build directory of ntask. The timestamps are
+    # preserved so that make treats them as up to date.
+    def seed_target(self, seed, ntask, independent):
+        seed_objdir = self.target_objdir(seed)
+        objdir = self.target_objdir(ntask)
+        mkdirp(objdir)
+        for base, mods in independent.items():
+            for f in [base + ".o", base + ".d"] + [m + ".mod" for m in mods]:
+                path = join_path(seed_objdir, f)
+                if os.path.isfile(path):
+                    shutil.copy2(path, objdir)
+
     def build(self, spec, prefix):
 
         build = Executable(
-                    join_path(self.stage.source_path, self.__buildscript_path)
+                    join_path(self.source_dir(), self.__buildscript_path)
                 )
 
-        for k in self.__targets:
+        thrd = "yes" if "+openmp" in spec else "no"
+        barriers = "yes" if "+barriers" in spec else "no"
+
+        def build_target(k, jobs):
+            env = {"MAKE_JOBS": str(jobs), "THRD": thrd, "BARRIERS": barriers}
+            if self.__targets[k]["mxblcks"]:
+                env["MAX_BLOCKS"] = self.__targets[k]["mxblcks"]
             build(self.__targets[k]["driver"],
                     self.__targets[k]["grid"],
                     self.__targets[k]["blocks"],
-                    str(k))
+                    str(k),
+                    extra_env=env)
+
+        # Share the Spack job budget between the concurrent targets
+        def build_concurrently(targets):
+            if not targets:
+                return
+            workers = max(1, min(len(targets), make_jobs))
+            jobs = max(1, make_jobs // workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(build_target, k, jobs) for k in targets]:
+                    future.result()
+
+        # Targets with the same source directories differ only in the grid
+        # macros, so the first target of each group seeds the others with its
+        # grid-independent objects.
+        groups = {}
+        for k in self.__targets:
+            groups.setdefault(tuple(self.target_srcdirs(k)), []).append(k)
+
+        build_concurrently([targets[0] for targets in groups.values()])
+
+        for srcdirs, targets in groups.items():
+            independent = self.grid_independent_sources(srcdirs)
+            print(f"INFO: sharing {len(independent)} grid-independent objects "
+                  f"of target {targets[0]}")
+            for k in targets[1:]:
+                self.seed_target(targets[0], k, independent)
+
+        build_concurrently([k for targets in groups.values() for k in targets[1:]])
+
+        if "+gather_scatter_bench" in spec:
+            mpifc = Executable(spec["mpi"].mpifc)
+            mpifc("-O2", "-o", join_path(self.source_dir(), self.__bench_exe),
+                  join_path(self.package_dir, self.__bench))
+
+    @run_after("install")
+    @on_package_attributes(run_tests=True)
+    def check_reproducible(self):
+        if "+reproducible" not in self.spec:
+            return
+        artefacts = {}
+        for k in self.__targets:
+            exe = "cice_" + self.target_name(k) + ".exe"
+            artefacts[join_path(self.prefix.bin, exe)] = join_path("build_" + self.target_name(k), exe)
+
+        def rebuild(srcdir):
+            # spack-build.sh builds in its working directory
+            self.__srcdir = srcdir
+            try:
+                with working_dir(srcdir):
+                    self.build(self.spec, self.prefix)
+            finally:
+                self.__srcdir = None
+
+        check_reproducible(self, artefacts, rebuild, exclude=["build_*"])
 
     def install(self, spec, prefix):
 
         mkdirp(prefix.bin)
         for k in self.__targets:
-            name = "_".join([self.__targets[k]["driver"],
-                                self.__targets[k]["grid"],
-                                self.__targets[k]["blocks"],
-                                str(k) + "p"])
+            name = self.target_name(k)
             install(join_path("build_" + name, "cice_" + name + ".exe"),
                     prefix.bin)
+        if "+gather_scatter_bench" in spec:
+            install(self.__bench_exe, prefix.bin)
@@ -38,9 +38,9 @@ endif
 setenv CAM_ICE    no        # set to yes for CAM runs (single column)
 setenv SHRDIR     csm_share # location of CCSM shared code
 setenv DITTO      no        # reproducible diagnostics
-setenv THRD       no        # set to yes for OpenMP threading
+if !($?THRD) setenv THRD no # set to yes for OpenMP threading, set by Spack
 if ( $THRD == 'yes') setenv OMP_NUM_THREADS 2 # positive integer 
-setenv BARRIERS   yes       # set -Dgather_scatter_barrier, prevents hangs on raijin
+if !($?BARRIERS) setenv BARRIERS yes # set -Dgather_scatter_barrier, prevents hangs on raijin, set by Spack
 setenv NSNWLYR    1         # number of vertical layers in the snow
 setenv NICECAT    5         # number of ice thickness categories
 setenv OASIS3_MCT yes	      # oasis3-mct version
@@ -72,7 +72,10 @@ else #driver = auscom
   ### The version of an executable can be found with the following
   ### command: strings <executable> | grep 'CICE_VERSION='
   set version='202301'
-  sed -e "s/{CICE_VERSION}/$version/g" $SRCDIR/drivers/$driver/version.F90.template > $SRCDIR/drivers/$driver/version_mod.F90
+  ### Only replace version_mod.F90 if it changes, as targets are built concurrently
+  set version_mod = $SRCDIR/drivers/$driver/version_mod.F90
+  sed -e "s/{CICE_VERSION}/$version/g" $SRCDIR/drivers/$driver/version.F90.template > $version_mod.$$
+  cmp -s $version_mod.$$ $version_mod && rm -f $version_mod.$$ || mv -f $version_mod.$$ $version_mod
 endif
 
 
@@ -92,6 +95,11 @@ setenv BLCKY `expr $NYGLOB / $NYBLOCK` # y-dimension of blocks (  ghost cells  )
 @ a = $NXGLOB * $NYGLOB ; @ b = $BLCKX * $BLCKY * $NTASK
 @ m = $a / $b ; setenv MXBLCKS $m ; if ($MXBLCKS == 0) setenv MXBLCKS 1
 echo Autimatically generated: MXBLCKS = $MXBLCKS
+### A layout can override MXBLCKS, e.g. when land blocks are eliminated
+if ($?MAX_BLOCKS) then
+  setenv MXBLCKS $MAX_BLOCKS
+  echo Overridden: MXBLCKS = $MXBLCKS
+endif
 
 ###########################################
 # ars599: 24032014
@@ -121,7 +129,7 @@ else
   setenv IODIR io_binary
 endif
 
-cp -f $CBLD/Makefile.std $CBLD/Makefile
+cmp -s $CBLD/Makefile.std $CBLD/Makefile || cp -f $CBLD/Makefile.std $CBLD/Makefile
 
 if ($NTASK == 1) then
    setenv COMMDIR serial
@@ -141,9 +149,19 @@ $SRCDIR/$IODIR
 $SRCDIR/$SHRDIR
 EOF
 
-cc -o makdep $CBLD/makdep.c || exit 2
+### Compile the dependency generator once and share it between targets.
+### Compile to a temporary name so that concurrent builds do not race.
+if !(-x $CBLD/makdep) then
+  cc -o $CBLD/makdep.$$ $CBLD/makdep.c || exit 2
+  mv -f $CBLD/makdep.$$ $CBLD/makdep
+endif
+ln -sf $CBLD/makdep makdep
+
+### The dependencies generated by makdep order the Fortran modules,
+### so make can run in parallel. MAKE_JOBS is set by Spack.
+if !($?MAKE_JOBS) setenv MAKE_JOBS 1
 
-make VPFILE=Filepath EXEC=cice_${driver}_${grid}_${blocks}_${ntask}p.exe \
+make -j $MAKE_JOBS VPFILE=Filepath EXEC=cice_${driver}_${grid}_${blocks}_${ntask}p.exe \
            NXGLOB=$NXGLOB NYGLOB=$NYGLOB \
            BLCKX=$BLCKX BLCKY=$BLCKY MXBLCKS=$MXBLCKS \
            -f  $CBLD/Makefile MACFILE=$CBLD/Macros.spack || exit 2
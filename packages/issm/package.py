@@ -70,6 +70,12 @@ class Issm(AutotoolsPackage):
         description="Install ISSM python files under <prefix>/python-tools",
     )
 
+    variant(
+        "debug",
+        default=True,
+        description="Configure with --enable-debugging and --enable-development",
+    )
+
     # --------------------------------------------------------------------
     # Dependencies
     # --------------------------------------------------------------------
@@ -117,6 +123,12 @@ class Issm(AutotoolsPackage):
     # +py-tools requires +wrappers for full Python functionality
     conflicts("+py-tools", when="~wrappers", msg="The +py-tools variant requires +wrappers for full functionality")
 
+    # --------------------------------------------------------------------
+    # Out-of-tree build directory, kept in the source tree so that
+    # `spack develop` builds reuse it and only recompile what changed
+    # --------------------------------------------------------------------
+    build_directory = "spack-build"
+
     # --------------------------------------------------------------------
     # Helper functions
     # --------------------------------------------------------------------
@@ -154,13 +166,14 @@ class Issm(AutotoolsPackage):
     # --------------------------------------------------------------------
     def configure_args(self):
         args = [
-            "--enable-debugging",
-            "--enable-development",
             "--enable-shared",
             "--without-kriging",
             "--without-Love",
         ]
 
+        if "+debug" in self.spec:
+            args += ["--enable-debugging", "--enable-development"]
+
         # Linear-algebra backend
         if "+ad" in self.spec:
             # AD build: *exclude* PETSc and point at CoDiPack/MediPack
@@ -215,7 +228,8 @@ class Issm(AutotoolsPackage):
     # Install phase - delegate to standard make install & copy examples
     # --------------------------------------------------------------------
     def install(self, spec, prefix):
-        make("install", parallel=False)
+        with working_dir(self.build_directory):
+            make("install")
 
         # Optionally install examples directory
         if "+examples" in self.spec:
@@ -5,7 +5,10 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import os
+
 from spack.package import *
+from spack.pkg.access.nri.access_build_utils import check_reproducible
 
 class Libaccessom2(CMakePackage):
     """libaccessom2 is a library that is linked into all of the ACCESS-OM2 component models, including YATM, CICE and MOM. libaccessom2 provides functionality used by all models as well as providing a interface to inter-model communication and synchronisation tasks."""
@@ -19,6 +22,8 @@ class Libaccessom2(CMakePackage):
 
     variant("deterministic", default=False, description="Deterministic build.")
     variant("optimisation_report", default=False, description="Generate optimisation reports.")
+    variant("reproducible", default=False, description="Reproducible optimised build.")
+    conflicts("+deterministic", when="+reproducible", msg="+reproducible replaces +deterministic")
     variant('build_type',
             default='Release',
             description='The build type to build',
@@ -31,6 +36,7 @@ class Libaccessom2(CMakePackage):
     depends_on("mpi")
     depends_on("oasis3-mct+deterministic", when="+deterministic")
     depends_on("oasis3-mct~deterministic", when="~deterministic")
+    depends_on("oasis3-mct+reproducible", when="+reproducible")
     depends_on("datetime-fortran")
     depends_on("json-fortran")
     depends_on("netcdf-fortran@4.5.2:")
@@ -44,15 +50,61 @@ class Libaccessom2(CMakePackage):
             filter_file(r"-traceback", "", "CMakeLists.txt")
             filter_file(r"-g3 -O2", "-g0 -O0", "CMakeLists.txt")
 
+        if "+reproducible" in self.spec:
+            filter_file(r"-traceback", "", "CMakeLists.txt")
+            filter_file(r"-g3 -O2", "-g0 -O2", "CMakeLists.txt")
+
         if "~optimisation_report" in self.spec:
             filter_file(r"-qopt-report=5 -qopt-report-annotate",
                         "",
                         "CMakeLists.txt"
             )
 
+    def setup_build_environment(self, env):
+        if "+reproducible" in self.spec:
+            env.set("SOURCE_DATE_EPOCH", "0")
+
     def cmake_args(self):
-        return [
+        args = [
             self.define("CMAKE_C_COMPILER", self.spec["mpi"].mpicc),
             self.define("CMAKE_CXX_COMPILER", self.spec["mpi"].mpicxx),
             self.define("CMAKE_Fortran_COMPILER", self.spec["mpi"].mpifc),
         ]
+
+        if "+reproducible" in self.spec:
+            # Create archives without timestamps, uids or modes
+            for lang in ["C", "Fortran"]:
+                args.extend([
+                    self.define(f"CMAKE_{lang}_ARCHIVE_CREATE",
+                                "<CMAKE_AR> qcD <TARGET> <LINK_FLAGS> <OBJECTS>"),
+                    self.define(f"CMAKE_{lang}_ARCHIVE_APPEND",
+                                "<CMAKE_AR> qD <TARGET> <LINK_FLAGS> <OBJECTS>"),
+                    self.define(f"CMAKE_{lang}_ARCHIVE_FINISH", "<CMAKE_RANLIB> -D <TARGET>"),
+                ])
+
+        return args
+
+    @run_after("install")
+    @on_package_attributes(run_tests=True)
+    def check_reproducible(self):
+        if "+reproducible" not in self.spec:
+            return
+        built = {}
+        for root, _, files in os.walk(self.build_directory):
+            for f in files:
+                if f.endswith(".a"):
+                    built[f] = os.path.relpath(join_path(root, f), self.build_directory)
+        # Configure and build the copy of the source in a build directory of its own
+        rebuild_dir = "spack-build"
+        artefacts = {
+            join_path(self.prefix.lib, f): join_path(rebuild_dir, built[f])
+            for f in os.listdir(self.prefix.lib) if f in built
+        }
+
+        def rebuild(srcdir):
+            build_dir = join_path(srcdir, rebuild_dir)
+            cmake = Executable(self.spec["cmake"].prefix.bin.cmake)
+            cmake("-S", srcdir, "-B", build_dir, *self.std_cmake_args, *self.cmake_args())
+            cmake("--build", build_dir, f"--parallel={make_jobs}")
+
+        check_reproducible(self, artefacts, rebuild, exclude=[rebuild_dir])
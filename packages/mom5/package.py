@@ -4,9 +4,37 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import math
+import os
+import re
+
 from spack.build_systems import cmake, makefile
 from spack.version.version_types import GitVersion, StandardVersion
 from spack.package import *
+from spack.pkg.access.nri.access_build_utils import check_reproducible, target_flags
+
+# A static memory build is grid:layout, e.g. 360x300x50:24x15
+_static_re = re.compile(r"^(\d+)x(\d+)x(\d+):(\d+)x(\d+)$")
+
+
+def valid_static(value):
+    return value == "none" or _static_re.match(value) is not None
+
+
+def static_builds(spec):
+    """Return the name suffix and the CPP definitions of each static memory build."""
+    builds = {}
+    for value in spec.variants["static"].value:
+        if value == "none":
+            continue
+        ni, nj, nk, npx, npy = (int(n) for n in _static_re.match(value).groups())
+        if ni % npx or nj % npy:
+            raise InstallError(f"static: the layout of {value} does not divide the grid evenly")
+        builds[f"static-{ni}x{nj}x{nk}-{npx}x{npy}"] = (
+            f"-DMOM_STATIC_ARRAYS -DNI_={ni} -DNJ_={nj} -DNK_={nk} "
+            f"-DNI_LOCAL_={ni // npx} -DNJ_LOCAL_={nj // npy}"
+        )
+    return builds
 
 
 class Mom5(CMakePackage, MakefilePackage):
@@ -40,6 +68,16 @@ class Mom5(CMakePackage, MakefilePackage):
             values=("Debug", "Release", "RelWithDebInfo")
         )
         variant("deterministic", default=False, description="Deterministic build")
+        variant(
+            "pgo",
+            default=False,
+            description="Profile-guided optimisation, trained with a mom_solo box case"
+        )
+        depends_on("fre-nctools", type="build", when="+pgo")
+        # GCC names its profiles after the object paths, which differ
+        # between the training and production builds.
+        conflicts("%gcc", when="+pgo", msg="+pgo requires the intel or oneapi compilers")
+        variant("ipo", default=False, description="Interprocedural (link-time) optimisation")
 
     with when("build_system=makefile"):
         variant("restart_repro", default=True, description="Reproducible restart build.")
@@ -55,6 +93,32 @@ class Mom5(CMakePackage, MakefilePackage):
             description="Generate optimisation reports",
             when="@access-om2,legacy-access-om2-bgc"
         )
+    # Each grid:layout adds an executable with MOM_STATIC_ARRAYS, whose
+    # arrays are sized at compile time, next to the dynamic memory one.
+    # The layout must divide the grid evenly and match ocean_model_nml.
+    variant(
+        "static",
+        default="none",
+        values=valid_static,
+        multi=True,
+        description="Static memory builds for the grid:layouts, e.g. 360x300x50:24x15"
+    )
+
+    variant(
+        "reproducible",
+        default=False,
+        description="Reproducible optimised build",
+        when="@access-om2,legacy-access-om2-bgc"
+    )
+    conflicts("+deterministic", when="+reproducible", msg="+reproducible replaces +deterministic")
+    # The CMake build sets its own flags and archive options.
+    conflicts(
+        "build_system=cmake",
+        when="+reproducible",
+        msg="+reproducible requires build_system=makefile"
+    )
+
+    variant("openmp", default=False, description="Hybrid MPI and OpenMP build")
 
     with when("@mom,access-om2,legacy-access-om2-bgc,access-esm1.6"):
         depends_on("netcdf-c@4.7.4:")
@@ -66,6 +130,8 @@ class Mom5(CMakePackage, MakefilePackage):
         depends_on("datetime-fortran")
         depends_on("libaccessom2+deterministic", when="+deterministic")
         depends_on("libaccessom2~deterministic", when="~deterministic")
+        depends_on("libaccessom2+reproducible", when="+reproducible")
+        depends_on("oasis3-mct+reproducible", when="+reproducible")
 
     with when("@access-om2,legacy-access-om2-bgc,access-esm1.6"):
         depends_on("oasis3-mct+deterministic", when="+deterministic")
@@ -77,6 +143,17 @@ class Mom5(CMakePackage, MakefilePackage):
         depends_on("access-fms")
         depends_on("access-generic-tracers")
 
+    with when("@access-om2,legacy-access-om2-bgc,access-esm1.6 build_system=cmake"):
+        depends_on("access-fms+openmp", when="+openmp")
+        depends_on("access-generic-tracers+openmp", when="+openmp")
+
+    # The libraries linked into MOM5 must agree with it on IPO.
+    with when("@access-om2,legacy-access-om2-bgc,access-esm1.6 build_system=cmake"):
+        depends_on("access-fms+ipo", when="+ipo")
+        depends_on("access-fms~ipo", when="~ipo")
+        depends_on("access-generic-tracers+ipo", when="+ipo")
+        depends_on("access-generic-tracers~ipo", when="~ipo")
+
     # legacy-access-om2-bgc builds with access-generic-tracers but it
     # is not configured for use in ACCESS-OM2-BGC configurations.
     with when("@legacy-access-om2-bgc"):
@@ -92,6 +169,34 @@ class Mom5(CMakePackage, MakefilePackage):
     def url_for_version(self, version):
         return "https://github.com/ACCESS-NRI/mom5/tarball/{0}".format(version)
 
+    def setup_build_environment(self, env):
+        if self.spec.satisfies("+reproducible"):
+            env.set("SOURCE_DATE_EPOCH", "0")
+
+    def target_flags(self, legacy_cflags="", legacy_fflags=""):
+        """
+        Return the C and Fortran flags for the concretized target and compiler.
+        Generic targets get the legacy Intel flags, see target_flags() in access-build-utils.
+        """
+        spec = self.spec
+        cflags = target_flags(spec, legacy_cflags)
+        fflags = target_flags(spec, legacy_fflags)
+        # Align arrays to the width of the AVX-512 registers.
+        if (spec.target.vendor != "generic" and spec.compiler.name in ("intel", "oneapi")
+                and "avx512f" in spec.target):
+            fflags += " -align array64byte"
+        return cflags.strip(), fflags.strip()
+
+    def record_target_flags(self, cflags, fflags):
+        """Record the target flags used by this build in the install prefix."""
+        spec = self.spec
+        mkdirp(self.prefix.etc)
+        with open(join_path(self.prefix.etc, "mom5-target-flags"), "w") as flags_file:
+            flags_file.write(f"target={spec.target}\n")
+            flags_file.write(f"compiler={spec.compiler}\n")
+            flags_file.write(f"cflags={cflags}\n")
+            flags_file.write(f"fflags={fflags}\n")
+
 
 class CMakeBuilder(cmake.CMakeBuilder):
     root_cmakelists_dir = "cmake/"
@@ -108,6 +213,7 @@ class CMakeBuilder(cmake.CMakeBuilder):
         "legacy-access-om2-bgc": "MOM5_ACCESS_OM_BGC"
     }
     __version = "INVALID"
+    __target_flags = ("", "")
 
     # NOTE: This functionality will hopefully be implemented in the Spack core
     #       in the future. Till then, this approach can be used in other SPRs
@@ -132,12 +238,176 @@ class CMakeBuilder(cmake.CMakeBuilder):
                 " type=" + self.__builds[self.__version])
 
     def cmake_args(self):
+        return self.__cmake_args()
+
+    def __cmake_args(self, cppdefs=""):
         args = [
             self.define("MOM5_TYPE", self.__builds[self.__version]),
             self.define_from_variant("MOM5_DETERMINISTIC", "deterministic"),
+            self.define_from_variant("MOM5_OPENMP", "openmp"),
+            self.define_from_variant("CMAKE_INTERPROCEDURAL_OPTIMIZATION", "ipo"),
+            self.define("CMAKE_POLICY_DEFAULT_CMP0069", "NEW"),
         ]
+        # The CMake build had no architecture flags, so generic targets get none.
+        self.__target_flags = self.pkg.target_flags()
+        cflags, fflags = self.__target_flags
+        if self.spec.satisfies("+openmp"):
+            openmp = self.pkg.compiler.openmp_flag
+            cflags, fflags = f"{cflags} {openmp}", f"{fflags} {openmp}"
+            args.append(self.define("CMAKE_EXE_LINKER_FLAGS", openmp))
+        if self.spec.satisfies("+pgo"):
+            pgo = self.__pgo_flags(generate=False)
+            cflags, fflags = f"{cflags} {pgo}", f"{fflags} {pgo}"
+        fflags = f"{fflags} {cppdefs}"
+        # Leave the flags to the project's CMake files unless there are any to add.
+        if cflags.strip():
+            args.append(self.define("CMAKE_C_FLAGS", cflags.strip()))
+        if fflags.strip():
+            args.append(self.define("CMAKE_Fortran_FLAGS", fflags.strip()))
+        print(f"INFO: target={self.spec.target} cflags={cflags} fflags={fflags}")
         return args
 
+    @run_after("install")
+    def record_target_flags(self):
+        self.pkg.record_target_flags(*self.__target_flags)
+
+    @run_after("install")
+    def install_static(self):
+        """
+        Build each static memory grid:layout from the same sources, and install
+        its executables with the suffix of the build, e.g. _static-360x300x50-24x15.
+        """
+        pkg = self.pkg
+        cmake = Executable(self.spec["cmake"].prefix.bin.cmake)
+        for suffix, cppdefs in static_builds(self.spec).items():
+            build_dir = join_path(pkg.stage.path, f"spack-build-{suffix}")
+            static_prefix = join_path(pkg.stage.path, f"spack-install-{suffix}")
+            mkdirp(build_dir)
+            with working_dir(build_dir):
+                cmake(
+                    join_path(pkg.stage.source_path, self.root_cmakelists_dir),
+                    *self.std_cmake_args,
+                    *self.__cmake_args(cppdefs),
+                )
+                cmake("--build", ".", "--parallel", str(make_jobs))
+                cmake("--install", ".", "--prefix", static_prefix)
+            executables = find(join_path(static_prefix, "bin"), f"*{self.__builds[self.__version]}*")
+            if not executables:
+                raise InstallError(f"No {self.__builds[self.__version]} executable found in {static_prefix}")
+            for exe in executables:
+                name, ext = os.path.splitext(os.path.basename(exe))
+                install(exe, join_path(pkg.prefix.bin, f"{name}_{suffix}{ext}"))
+
+    # The number of MPI ranks of the training case, matching the layout
+    # in pgo/input.nml, so that it runs on a single node.
+    __training_ranks = 4
+
+    def __profile_dir(self):
+        return join_path(self.pkg.stage.path, "pgo-profile")
+
+    def __pgo_flags(self, generate):
+        profile_dir = self.__profile_dir()
+        if self.spec.satisfies("%intel"):
+            if generate:
+                return f"-prof-gen -prof-dir={profile_dir}"
+            return f"-prof-use -prof-dir={profile_dir}"
+        # The oneapi compilers use LLVM instrumentation.
+        if generate:
+            return "-fprofile-instr-generate"
+        return "-fprofile-instr-use=" + join_path(profile_dir, "mom5.profdata")
+
+    def __make_training_case(self, run_dir):
+        # A flat-bottomed rectangular basin, generated with FRE-NCtools so
+        # that the training case needs no external data.
+        input_dir = join_path(run_dir, "INPUT")
+        mkdirp(input_dir)
+        mkdirp(join_path(run_dir, "RESTART"))
+        for name in ("input.nml", "field_table", "diag_table", "data_table"):
+            copy(join_path(self.pkg.package_dir, "pgo", name), run_dir)
+
+        tools = self.spec["fre-nctools"].prefix.bin
+        with working_dir(input_dir):
+            Executable(join_path(tools, "make_hgrid"))(
+                "--grid_type", "regular_lonlat_grid",
+                "--nxbnd", "2", "--nybnd", "2",
+                "--xbnd", "0,60", "--ybnd", "-30,30",
+                "--nlon", "120", "--nlat", "120",
+                "--grid_name", "ocean_hgrid"
+            )
+            Executable(join_path(tools, "make_vgrid"))(
+                "--nbnds", "2", "--bnds", "0,4000", "--nz", "50",
+                "--grid_name", "ocean_vgrid"
+            )
+            Executable(join_path(tools, "make_solo_mosaic"))(
+                "--num_tiles", "1", "--dir", ".",
+                "--mosaic_name", "ocean_mosaic",
+                "--tile_file", "ocean_hgrid.nc"
+            )
+            Executable(join_path(tools, "make_topog"))(
+                "--mosaic", "ocean_mosaic.nc",
+                "--topog_type", "rectangular_basin",
+                "--bottom_depth", "4000",
+                "--vgrid", "ocean_vgrid.nc",
+                "--output", "topog.nc"
+            )
+            Executable(join_path(tools, "make_quick_mosaic"))(
+                "--input_mosaic", "ocean_mosaic.nc",
+                "--ocean_topog", "topog.nc"
+            )
+
+    @run_before("cmake", when="+pgo")
+    def train(self):
+        pkg = self.pkg
+        spec = self.spec
+        profile_dir = self.__profile_dir()
+        mkdirp(profile_dir)
+
+        # Build an instrumented mom_solo from the same sources.
+        build_dir = join_path(pkg.stage.path, "spack-build-pgo")
+        solo_prefix = join_path(pkg.stage.path, "spack-install-pgo")
+        mkdirp(build_dir)
+        cflags, fflags = pkg.target_flags()
+        pgo = self.__pgo_flags(generate=True)
+        cmake = Executable(spec["cmake"].prefix.bin.cmake)
+        with working_dir(build_dir):
+            cmake(
+                join_path(pkg.stage.source_path, self.root_cmakelists_dir),
+                *self.std_cmake_args,
+                self.define("MOM5_TYPE", "MOM5_SOLO"),
+                self.define("CMAKE_C_FLAGS", f"{cflags} {pgo}"),
+                self.define("CMAKE_Fortran_FLAGS", f"{fflags} {pgo}"),
+                self.define("CMAKE_EXE_LINKER_FLAGS", pgo),
+            )
+            cmake("--build", ".", "--parallel", str(make_jobs))
+            cmake("--install", ".", "--prefix", solo_prefix)
+        executables = find(solo_prefix, "*MOM5_SOLO*")
+        if not executables:
+            raise InstallError(f"No MOM5_SOLO executable found in {solo_prefix}")
+
+        # Run the training case offline on this node.
+        run_dir = join_path(pkg.stage.path, "pgo-run")
+        self.__make_training_case(run_dir)
+        mpiexec = Executable(spec["mpi"].prefix.bin.mpiexec)
+        print(f"INFO: +pgo training with {executables[0]}")
+        with working_dir(run_dir):
+            mpiexec(
+                "-n", str(self.__training_ranks), executables[0],
+                extra_env={"LLVM_PROFILE_FILE": join_path(profile_dir, "mom5-%p.profraw")}
+            )
+
+        if spec.satisfies("%oneapi"):
+            compiler_bin = os.path.dirname(pkg.compiler.fc)
+            llvm_profdata = which(
+                "llvm-profdata",
+                path=[compiler_bin, join_path(compiler_bin, "compiler")],
+                required=True
+            )
+            llvm_profdata(
+                "merge",
+                "-output=" + join_path(profile_dir, "mom5.profdata"),
+                *find(profile_dir, "*.profraw", recursive=False)
+            )
+
 
 class MakefileBuilder(makefile.MakefileBuilder):
     phases = ("setup", "edit", "build", "install")
@@ -149,6 +419,10 @@ class MakefileBuilder(makefile.MakefileBuilder):
     }
     __version = "INVALID"
     __platform = "spack"
+    __target_flags = ("", "")
+
+    # Approximate peak memory (GiB) of a single optimised compile job.
+    __compile_mem_gib = {"gcc": 1, "intel": 2, "oneapi": 2}
 
     # NOTE: This functionality will hopefully be implemented in the Spack core
     #       in the future. Till then, this approach can be used in other SPRs
@@ -172,12 +446,96 @@ class MakefileBuilder(makefile.MakefileBuilder):
         print("INFO: version=" + self.__version +
                 " type=" + self.__builds[self.__version])
 
+    def __cgroup_paths(self, controller):
+        """Return the cgroup v2 and v1 directories of this process for controller."""
+        paths = []
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                _, controllers, path = line.strip().split(":", 2)
+                if controllers == "":
+                    paths.append(join_path("/sys/fs/cgroup", path.lstrip("/")))
+                elif controller in controllers.split(","):
+                    paths.append(join_path("/sys/fs/cgroup", controllers, path.lstrip("/")))
+        return paths
+
+    def __read_cgroup(self, path, name):
+        try:
+            with open(join_path(path, name)) as f:
+                return f.read().split()
+        except OSError:
+            return None
+
+    def __cpu_limit(self):
+        """Return the CPU quota of the cgroup of this process, if any."""
+        for path in self.__cgroup_paths("cpu"):
+            cpu_max = self.__read_cgroup(path, "cpu.max")
+            if cpu_max and cpu_max[0] != "max":
+                return math.ceil(int(cpu_max[0]) / int(cpu_max[1]))
+            quota = self.__read_cgroup(path, "cpu.cfs_quota_us")
+            period = self.__read_cgroup(path, "cpu.cfs_period_us")
+            if quota and period and int(quota[0]) > 0:
+                return math.ceil(int(quota[0]) / int(period[0]))
+        return None
+
+    def __memory_available(self):
+        """Return the memory (bytes) available to this process, if known."""
+        available = []
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available.append(int(line.split()[1]) * 1024)
+        for path in self.__cgroup_paths("memory"):
+            for limit_name, usage_name in (("memory.max", "memory.current"),
+                    ("memory.limit_in_bytes", "memory.usage_in_bytes")):
+                limit = self.__read_cgroup(path, limit_name)
+                usage = self.__read_cgroup(path, usage_name)
+                if limit and usage and limit[0] != "max":
+                    available.append(int(limit[0]) - int(usage[0]))
+        return min(available) if available else None
+
+    def __jobs(self, pkg):
+        """
+        Return the number of make jobs: Spack's make_jobs (which follows -j and
+        the CPU affinity of the build), limited by any cgroup CPU quota and by
+        the memory available for the compile jobs.
+        """
+        jobs = make_jobs
+        try:
+            cpu_limit = self.__cpu_limit()
+            memory = self.__memory_available()
+        except (OSError, ValueError):
+            cpu_limit = memory = None
+        if cpu_limit:
+            jobs = min(jobs, cpu_limit)
+        if memory:
+            job_mem = self.__compile_mem_gib.get(pkg.compiler.name, 2) * 2**30
+            jobs = min(jobs, memory // job_mem)
+        jobs = max(1, jobs)
+        print(f"INFO: make jobs={jobs}")
+        return jobs
+
+    def __static_builds(self, spec):
+        """Return the platform and the CPP definitions of each static memory build."""
+        return {
+            f"{self.__platform}-{suffix}": cppdefs
+            for suffix, cppdefs in static_builds(spec).items()
+        }
+
     def edit(self, pkg, spec, prefix):
 
         srcdir = pkg.stage.source_path
         makeinc_path = join_path(srcdir, "bin", "mkmf.template.spack")
         config = {}
 
+        # The architecture and vectorisation flags follow the concretized target.
+        # Generic targets keep the flags of the released builds.
+        if self.__version == "access-esm1.5":
+            self.__target_flags = pkg.target_flags("", "-xCORE-AVX512 -align array64byte")
+        else:
+            self.__target_flags = pkg.target_flags("-xCORE-AVX2", "-xCORE-AVX2")
+        CFLAGS_TARGET, FFLAGS_TARGET = self.__target_flags
+        print(f"INFO: target={spec.target} cflags={CFLAGS_TARGET} fflags={FFLAGS_TARGET}")
+
         # NOTE: The order of the libraries matters during the linking step!
         if self.__version == "access-esm1.5":
             istr = " ".join([
@@ -185,8 +543,8 @@ class MakefileBuilder(makefile.MakefileBuilder):
                     join_path((spec["oasis3-mct"].headers).cpp_flags, "mct")])
             ideps = ["netcdf-fortran"]
             ldeps = ["oasis3-mct", "netcdf-c", "netcdf-fortran"]
-            FFLAGS_OPT = "-O3 -debug minimal -xCORE-AVX512 -align array64byte"
-            CFLAGS_OPT = "-O2 -debug minimal -no-vec"
+            FFLAGS_OPT = f"-O3 -debug minimal {FFLAGS_TARGET}"
+            CFLAGS_OPT = f"-O2 -debug minimal -no-vec {CFLAGS_TARGET}"
         else:
             istr = join_path((spec["oasis3-mct"].headers).cpp_flags, "psmile.MPI1")
             ideps = ["oasis3-mct", "libaccessom2", "netcdf-fortran"]
@@ -194,14 +552,23 @@ class MakefileBuilder(makefile.MakefileBuilder):
             ldeps = ["oasis3-mct", "libaccessom2", "netcdf-c", "netcdf-fortran", "datetime-fortran"]
 
             # TODO: https://github.com/ACCESS-NRI/ACCESS-OM/issues/12
-            FFLAGS_OPT = "-g3 -O2 -xCORE-AVX2 -debug all -check none -traceback"
-            CFLAGS_OPT = "-O2 -debug minimal -xCORE-AVX2"
+            FFLAGS_OPT = f"-g3 -O2 {FFLAGS_TARGET} -debug all -check none -traceback"
+            CFLAGS_OPT = f"-O2 -debug minimal {CFLAGS_TARGET}"
             if self.spec.satisfies("+deterministic"):
-                FFLAGS_OPT = "-g0 -O0 -xCORE-AVX2 -debug none -check none"
-                CFLAGS_OPT = "-O0 -debug none -xCORE-AVX2"
+                FFLAGS_OPT = f"-g0 -O0 {FFLAGS_TARGET} -debug none -check none"
+                CFLAGS_OPT = f"-O0 -debug none {CFLAGS_TARGET}"
                 print("INFO: +deterministic applied")
+            if self.spec.satisfies("+reproducible"):
+                FFLAGS_OPT = f"-g0 -O2 {FFLAGS_TARGET} -fp-model precise -fp-model source -debug none -check none"
+                CFLAGS_OPT = f"-O2 -debug none {CFLAGS_TARGET}"
+                print("INFO: +reproducible applied")
+
+        # The recorded command line includes the paths of the stage.
+        GRECORD = "" if spec.satisfies("+reproducible") else "-grecord-gcc-switches"
 
         incs = " ".join([istr] + [(spec[d].headers).cpp_flags for d in ideps])
+        jobs = self.__jobs(pkg)
+        OPENMP = "on" if spec.satisfies("+openmp") else ""
         libs = " ".join([(spec[d].libs).ld_flags for d in ldeps])
 
         # Copied from bin/mkmf.template.ubuntu
@@ -215,9 +582,9 @@ LD = $(FC)
 DEBUG =
 REPRO =
 VERBOSE =
-OPENMP =
+OPENMP = {OPENMP}
 
-MAKEFLAGS += --jobs=$(shell grep '^processor' /proc/cpuinfo | wc -l)
+MAKEFLAGS += --jobs={jobs}
 
 FPPFLAGS := 
 
@@ -226,7 +593,7 @@ FFLAGS += {incs}
 FFLAGS += -DGFORTRAN
 
 #
-FFLAGS_OPT = -O2
+FFLAGS_OPT = -O2 {FFLAGS_TARGET}
 FFLAGS_REPRO = 
 FFLAGS_DEBUG = -O0 -g -W -fbounds-check 
 FFLAGS_OPENMP = -fopenmp
@@ -234,7 +601,7 @@ FFLAGS_VERBOSE =
 
 CFLAGS := -D__IFC {incs}
 CFLAGS += $(shell nc-config --cflags)
-CFLAGS_OPT = -O2
+CFLAGS_OPT = -O2 {CFLAGS_TARGET}
 CFLAGS_OPENMP = -fopenmp
 CFLAGS_DEBUG = -O0 -g 
 
@@ -301,8 +668,9 @@ CC = mpicc
 REPRO =
 VERBOSE =
 OPT = on
+OPENMP = {OPENMP}
 
-MAKEFLAGS += --jobs=4
+MAKEFLAGS += --jobs={jobs}
 
 INCLUDE = {incs}
 
@@ -311,13 +679,16 @@ FFLAGS := -fno-alias -safe-cray-ptr -fpe0 -ftz -assume byterecl -i4 -r8 -traceba
 FFLAGS_OPT = {FFLAGS_OPT}
 FFLAGS_DEBUG = -g -O0 -debug all -check -check noarg_temp_created -check nopointer -warn -warn noerrors -ftrapuv
 FFLAGS_REPRO = -O2 -debug minimal -no-vec -fp-model precise
+FFLAGS_OPENMP = -qopenmp
 FFLAGS_VERBOSE = -v -V -what
 
 CFLAGS := -D__IFC $(INCLUDE)
 CFLAGS_OPT = {CFLAGS_OPT}
 CFLAGS_DEBUG = -O0 -g -ftrapuv -traceback
+CFLAGS_OPENMP = -qopenmp
 
 LDFLAGS :=
+LDFLAGS_OPENMP := -qopenmp
 LDFLAGS_VERBOSE := -Wl,-V,--verbose,-cref,-M
 
 ifneq ($(REPRO),)
@@ -333,6 +704,12 @@ CFLAGS += $(CFLAGS_OPT)
 FFLAGS += $(FFLAGS_OPT)
 endif
 
+ifneq ($(OPENMP),)
+CFLAGS += $(CFLAGS_OPENMP)
+FFLAGS += $(FFLAGS_OPENMP)
+LDFLAGS += $(LDFLAGS_OPENMP)
+endif
+
 ifneq ($(VERBOSE),)
 CFLAGS += $(CFLAGS_VERBOSE)
 FFLAGS += $(FFLAGS_VERBOSE)
@@ -357,26 +734,30 @@ CC := mpicc
 
 VERBOSE :=
 OPT := on
+OPENMP := {OPENMP}
 
-MAKEFLAGS += -j
+MAKEFLAGS += --jobs={jobs}
 
 INCLUDE   := {incs}
 
 FPPFLAGS := -fpp -Wp,-w $(INCLUDE)
-FFLAGS := -fno-alias -safe-cray-ptr -fpe0 -ftz -assume byterecl -i4 -r8 -nowarn -check noarg_temp_created -assume nobuffered_io -convert big_endian -grecord-gcc-switches -align all
+FFLAGS := -fno-alias -safe-cray-ptr -fpe0 -ftz -assume byterecl -i4 -r8 -nowarn -check noarg_temp_created -assume nobuffered_io -convert big_endian {GRECORD} -align all
 FFLAGS_OPT := {FFLAGS_OPT}
 FFLAGS_REPORT := -qopt-report=5 -qopt-report-annotate
 FFLAGS_DEBUG := -g3 -O0 -debug all -check -check noarg_temp_created -check nopointer -warn -warn noerrors -ftrapuv -traceback
 FFLAGS_REPRO := -fp-model precise -fp-model source -align all
+FFLAGS_OPENMP := -qopenmp
 FFLAGS_VERBOSE := -v -V -what
 
 CFLAGS := -D__IFC $(INCLUDE)
 CFLAGS_OPT := {CFLAGS_OPT}
 CFLAGS_REPORT := -qopt-report=5 -qopt-report-annotate
 CFLAGS_DEBUG := -O0 -g -ftrapuv -traceback
+CFLAGS_OPENMP := -qopenmp
 CFLAGS_REPRO := -fp-model precise -fp-model source
 
 LDFLAGS :=
+LDFLAGS_OPENMP := -qopenmp
 LDFLAGS_VERBOSE := -Wl,-V,--verbose,-cref,-M
 
 ifneq ($(REPRO),)
@@ -392,6 +773,12 @@ CFLAGS += $(CFLAGS_OPT)
 FFLAGS += $(FFLAGS_OPT)
 endif
 
+ifneq ($(OPENMP),)
+CFLAGS += $(CFLAGS_OPENMP)
+FFLAGS += $(FFLAGS_OPENMP)
+LDFLAGS += $(LDFLAGS_OPENMP)
+endif
+
 ifneq ($(VERBOSE),)
 CFLAGS += $(CFLAGS_VERBOSE)
 FFLAGS += $(FFLAGS_VERBOSE)
@@ -601,12 +988,21 @@ TMPFILES = .*.m *.T *.TT *.hpm *.i *.lst *.proc *.s
         with open(makeinc_path, "w") as makeinc:
             makeinc.write(fullconfig)
 
+        for platform, cppdefs in self.__static_builds(spec).items():
+            print(f"INFO: {platform} CPPDEFS += {cppdefs}")
+            with open(join_path(srcdir, "bin", f"mkmf.template.{platform}"), "w") as makeinc:
+                makeinc.write(fullconfig + f"\nCPPDEFS += {cppdefs}\n")
+
     def build(self, pkg, spec, prefix):
+        self.__compile(
+            pkg, pkg.stage.source_path, [self.__platform] + list(self.__static_builds(spec)))
+
+    def __compile(self, pkg, srcdir, platforms):
 
         # cd ${ACCESS_OM_DIR}/src/mom/exp
         # export mom_type=ACCESS-OM
         # ./MOM_compile.csh --type $mom_type --platform spack
-        with working_dir(join_path(pkg.stage.source_path, "exp")):
+        with working_dir(join_path(srcdir, "exp")):
             build = Executable("./MOM_compile.csh")
 
             if pkg.spec.satisfies("+restart_repro"):
@@ -622,13 +1018,40 @@ TMPFILES = .*.m *.T *.TT *.hpm *.i *.lst *.proc *.s
                     build.add_default_env("REPORT", "true")
                     print("INFO: +optimisation_report applied")
 
-            build(
-                "--type",
-                self.__builds[self.__version],
-                "--platform",
-                self.__platform,
-                "--no_environ"
-            )
+            for platform in platforms:
+                build(
+                    "--type",
+                    self.__builds[self.__version],
+                    "--platform",
+                    platform,
+                    "--no_environ"
+                )
+
+    @run_after("install")
+    def record_target_flags(self):
+        self.pkg.record_target_flags(*self.__target_flags)
+        # Keep the generated mkmf template alongside the recorded flags.
+        for platform in [self.__platform] + list(self.__static_builds(self.pkg.spec)):
+            install(
+                join_path(self.pkg.stage.source_path, "bin", f"mkmf.template.{platform}"),
+                self.pkg.prefix.etc)
+
+    @run_after("install")
+    @on_package_attributes(run_tests=True)
+    def check_reproducible(self):
+        pkg = self.pkg
+        if not pkg.spec.satisfies("+reproducible"):
+            return
+        exe = "fms_" + self.__builds[self.__version] + ".x"
+        artefacts = {
+            join_path(pkg.prefix.bin, exe): join_path(
+                "exec", self.__platform, self.__builds[self.__version], exe)
+        }
+
+        def rebuild(srcdir):
+            self.__compile(pkg, srcdir, [self.__platform])
+
+        check_reproducible(pkg, artefacts, rebuild, exclude=["exec"])
 
     def install(self, pkg, spec, prefix):
 
@@ -644,3 +1067,12 @@ TMPFILES = .*.m *.T *.TT *.hpm *.i *.lst *.proc *.s
         )
         install(join_path("bin", "mppnccombine." + self.__platform), prefix.bin)
 
+        # e.g. fms_ACCESS-OM_static-360x300x50-24x15.x
+        for platform in self.__static_builds(spec):
+            exe = "fms_" + self.__builds[self.__version]
+            suffix = platform[len(self.__platform) + 1:]
+            install(
+                join_path("exec", platform, self.__builds[self.__version], exe + ".x"),
+                join_path(prefix.bin, f"{exe}_{suffix}.x")
+            )
+
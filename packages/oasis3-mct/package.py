@@ -5,7 +5,15 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import os
+
 from spack.package import *
+from spack.pkg.access.nri.access_build_utils import (
+    OPT_LEVELS,
+    check_reproducible,
+    optimisation_flags,
+    target_flags,
+)
 
 
 # https://spack.readthedocs.io/en/latest/build_systems/makefilepackage.html
@@ -34,6 +42,16 @@ class Oasis3Mct(MakefilePackage):
 
     variant("deterministic", default=False, description="Deterministic build.")
     variant("optimisation_report", default=False, description="Generate optimisation reports.")
+    # Bitwise-identical builds at -O2, checked by rebuilding when tests are enabled.
+    variant("reproducible", default=False, description="Reproducible optimised build.")
+    conflicts("+deterministic", when="+reproducible", msg="+reproducible replaces +deterministic")
+    variant(
+        "opt_level",
+        default="production",
+        values=OPT_LEVELS,
+        multi=False,
+        description="Optimisation level, tuned to the target and compiler.",
+    )
 
     depends_on("netcdf-fortran@4.5.2:")
     # Depend on virtual package "mpi".
@@ -97,6 +115,10 @@ Cflags: -I${{includedir}}/{k}
             if nchars_written < len(text):
                 raise OSError
 
+    def setup_build_environment(self, env):
+        if self.spec.satisfies("+reproducible"):
+            env.set("SOURCE_DATE_EPOCH", "0")
+
     # https://spack-tutorial.readthedocs.io/en/ecp21/tutorial_advanced_packaging.html
     @property
     def libs(self):
@@ -115,15 +137,26 @@ Cflags: -I${{includedir}}/{k}
         config = {}
 
         # TODO: https://github.com/ACCESS-NRI/ACCESS-OM/issues/12
-        NCI_OPTIM_FLAGS = "-g3 -O2 -axCORE-AVX2 -debug all -check none -traceback"
-        CFLAGS = ""
-        if "@access-esm1.5" in self.spec:
-            NCI_OPTIM_FLAGS = "-g3 -O2 -xCORE-AVX512 -debug all -check none -traceback"
+        LEGACY_FLAGS = "-xCORE-AVX512" if "@access-esm1.5" in self.spec else "-axCORE-AVX2"
+        OPT_LEVEL = self.spec.variants["opt_level"].value
+        NCI_OPTIM_FLAGS = (
+            f"-g3 {optimisation_flags(self.spec, OPT_LEVEL, '-O2')} "
+            f"{target_flags(self.spec, LEGACY_FLAGS)} -debug all -check none -traceback"
+        )
+        # The released builds left the C and GCC Fortran flags to the compiler.
+        OPT_FLAGS = f"{optimisation_flags(self.spec, OPT_LEVEL)} {target_flags(self.spec)}".strip()
+        CFLAGS = OPT_FLAGS
 
         if "+deterministic" in self.spec:
-            NCI_OPTIM_FLAGS = "-g0 -O0 -axCORE-AVX2 -debug none -check none"
+            NCI_OPTIM_FLAGS = f"-g0 -O0 {target_flags(self.spec, '-axCORE-AVX2')} -debug none -check none"
             CFLAGS = "-g0"
 
+        # ARFLAGS below already creates deterministic archives.
+        if "+reproducible" in self.spec:
+            NCI_OPTIM_FLAGS = f"-g0 -O2 {target_flags(self.spec, LEGACY_FLAGS)} -debug none -check none"
+            OPT_FLAGS = f"-g0 -O2 {target_flags(self.spec)}".strip()
+            CFLAGS = OPT_FLAGS
+
         if "+optimisation_report" in self.spec:
             NCI_OPTIM_FLAGS += " -qopt-report=5 -qopt-report-annotate"
 
@@ -145,7 +178,7 @@ f90         = $(F90)
 f           = $(F90)
 """
 
-        config["gcc"] = """
+        config["gcc"] = f"""
 # Compiling and other commands
 MAKE        = make
 F90         = mpif90 -Wall -fallow-argument-mismatch
@@ -156,7 +189,7 @@ MCT_FCFLAGS =
 # CPP keys and compiler options
 # 
 CPPDEF    = -Duse_netCDF -Duse_comm_$(CHAN) -D__VERBOSE -DTREAT_OVERLAY
-F90FLAGS_1  = 
+F90FLAGS_1  = {OPT_FLAGS}
 """
 
         # module load intel-compiler/2019.5.281
@@ -224,18 +257,43 @@ CCFLAGS   = $(CCFLAGS_1) $(INCPSMILE) $(CPPDEF)
                 + config["post"]
             )
 
+    def __make(self, srcdir):
+        with working_dir(join_path(srcdir, self.__makefiledir)):
+            build = Executable("make")
+            build("-f", "TopMakefileOasis3", f"--jobs={make_jobs}")
+
     def build(self, spec, prefix):
         # See doc/oasis3mct_UserGuide.pdf:
         #
         # compiles all OASIS3-MCT libraries mct, scrip and psmile:
         # make -f TopMakefileOasis3
-        with working_dir(join_path(self.stage.source_path, self.__makefiledir)):
-            build = Executable("make")
-            build("-f", "TopMakefileOasis3")
+        #
+        # TopMakefileOasis3 builds mct/mpeu before psmile, and the recursive
+        # $(MAKE) calls share the jobs through the make jobserver, so each
+        # library is compiled in parallel following its own dependencies.
+        self.__make(self.stage.source_path)
 
         # Upstream is missing a pkgconfig files, so we'll create them.
         self.__create_pkgconfig(spec, prefix)
 
+    @run_after("install")
+    @on_package_attributes(run_tests=True)
+    def check_reproducible(self):
+        if "+reproducible" not in self.spec:
+            return
+        libdir = join_path(self.stage.source_path, self.__libdir)
+        artefacts = {
+            join_path(self.prefix.lib, f): join_path(self.__libdir, f)
+            for f in os.listdir(libdir) if f.endswith(".a")
+        }
+
+        def rebuild(srcdir):
+            # make.inc names the source directory, as COUPLE
+            filter_file(r"^COUPLE=.*$", f"COUPLE={srcdir}", join_path(srcdir, self.__makeinc))
+            self.__make(srcdir)
+
+        check_reproducible(self, artefacts, rebuild, exclude=[self.__builddir])
+
     def install(self, spec, prefix):
 
         install_tree(self.__libdir, prefix.lib)
@@ -7,6 +7,10 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import configparser
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from spack.package import *
 import llnl.util.tty as tty
 import spack.util.git
@@ -115,6 +119,11 @@ class Um(Package):
     for var in _str_variants:
         variant(var, default="none", description=var, values="*", multi=False)
 
+    # The cache directory is not passed to FCM, and so is not one of the
+    # string variants above.
+    variant("cache_dir", default="none", values="*", multi=False,
+        description="Directory for persistent caches shared between builds")
+
     # The 'site=nci-gadi' variant of fcm defines the keywords
     # used by the FCM configuration of UM.
     depends_on("fcm site=nci-gadi", type="build")
@@ -162,6 +171,26 @@ class Um(Package):
             "fcm_name": "netcdf",
             "fcm_ld_flags": "-lnetcdff -lnetcdf"}}
 
+    # Compile steps that are independent of each other once the sources
+    # have been extracted, and so can be run as concurrent FCM make commands.
+    _concurrent_steps = ("atmos", "recon")
+
+    # The trunk of each component extracted by FCM make,
+    # mirrored into cache_dir by revision.
+    _extract_trunks = {
+        "casim": "fcm:casim.xm_tr",
+        "jules": "fcm:jules.xm_tr",
+        "shumlib": "fcm:shumlib.xm_tr",
+        "socrates": "fcm:socrates.xm_tr",
+        "ukca": "fcm:ukca.xm_tr",
+        "um": "fcm:um.xm_tr"}
+
+    # The directory containing the build directories, if not the stage.
+    _build_root = None
+
+    # The file marking a prebuild in cache_dir as complete.
+    _prebuild_complete = "prebuild-complete"
+
     # Optional Github sources to be used in build (i.e. AM3)
     _resource_cfg = {
         "jules_ref": {
@@ -288,6 +317,9 @@ class Um(Package):
             if len(key) > 0 and key[0] != '!':
                 config_env[key] = config["env"][key].replace("\n=", "\n")
 
+        # Keep the model configuration, which keys the prebuilds.
+        self._model_env = dict(config_env)
+
         # Override the model UM revision based on the spec UM version.
         key = "um_rev"
         spec_um_rev = f"vn{spec.version}"
@@ -383,15 +415,25 @@ class Um(Package):
             tty.info(f"{key}={config_env[key]}")
             env.set(key, config_env[key])
 
+        # Keep the resolved configuration for the build phase.
+        self._config_env = config_env
+
         # Add the location of the FCM executable to PATH.
         env.prepend_path("PATH", spec["fcm"].prefix.bin)
 
 
-    def _build_dir(self):
+    def _build_dir(self, step=None):
         """
-        Return the build directory.
+        Return the build directory, or the build directory of
+        the concurrent FCM make command for step.
         """
-        return join_path(self.stage.source_path, "..", "spack-build")
+        build_root = self._build_root
+        if build_root is None:
+            build_root = join_path(self.stage.source_path, "..")
+        build_dir = join_path(build_root, "spack-build")
+        if step is None:
+            return build_dir
+        return f"{build_dir}-{step}"
 
 
     def patch(self):
@@ -420,19 +462,236 @@ class Um(Package):
                         dst_dir=resource_path)
 
 
-    def build(self, spec, prefix):
+    def _mirror_extract(self, ns, rev):
         """
-        Use FCM to build the executables.
+        Return the path of the local copy of the trunk of component ns at
+        revision rev, exporting it into cache_dir if it is not there yet.
+        Return None if the revision is not fixed or the export fails.
+        """
+        if rev in ("", "HEAD"):
+            return None
+        cache_dir = self.spec.variants["cache_dir"].value
+        mirror_path = join_path(cache_dir, "extract", ns, rev.replace("/", "_"))
+        if os.path.isdir(mirror_path):
+            tty.info(f"Using the extract mirror {mirror_path}")
+            return mirror_path
+
+        # Export to a private directory, then rename, so that concurrent
+        # builds never see a partial tree.
+        mkdirp(os.path.dirname(mirror_path))
+        export_path = f"{mirror_path}.{os.getpid()}"
+        fcm = which("fcm")
+        try:
+            fcm("export", "--quiet", f"{self._extract_trunks[ns]}@{rev}", export_path)
+        except ProcessError:
+            tty.warn(f"Could not export {ns}@{rev} to {mirror_path}.")
+            shutil.rmtree(export_path, ignore_errors=True)
+            return None
+        try:
+            os.rename(export_path, mirror_path)
+        except OSError:
+            # Another build has created the mirror in the meantime.
+            shutil.rmtree(export_path, ignore_errors=True)
+        return mirror_path
+
+
+    def _make_config_file(self):
+        """
+        Return the FCM make configuration file. If cache_dir is set, this
+        includes the package configuration and points the base location of
+        each component at its local mirror.
         """
         config_file = join_path(self.package_dir, "fcm-make.cfg")
-        build_dir = self._build_dir()
+        if self.spec.variants["cache_dir"].value == "none":
+            return config_file
+
+        lines = [f"include = {config_file}"]
+        for ns in sorted(self._extract_trunks):
+            rev = self._config_env.get(f"{ns}_rev", "")
+            mirror_path = self._mirror_extract(ns, rev)
+            if mirror_path is not None:
+                lines.append(f"extract.location[{ns}] = {mirror_path}")
+        mirror_config_file = join_path(self.stage.path, "fcm-make-mirror.cfg")
+        with open(mirror_config_file, "w") as cfg_file:
+            cfg_file.write("\n".join(lines) + "\n")
+        return mirror_config_file
+
+
+    def _fcm_make(self, build_dir, jobs, **extra_env):
+        """
+        Run FCM make in build_dir using the given number of jobs,
+        overriding the configuration environment with extra_env.
+        """
+        config_file = self._fcm_config_file
         mkdirp(build_dir)
         fcm = which("fcm")
         fcm("make",
             "--new",
             f"--config-file={config_file}",
             f"--directory={build_dir}",
-            "--jobs=4")
+            f"--jobs={jobs}",
+            extra_env=extra_env)
+
+
+    def _source_overrides(self):
+        """
+        Return the names of the sources and revisions in the configuration
+        that the spec overrides, directly or through a reference variant.
+        """
+        spec = self.spec
+        overrides = set()
+        for var in self._rev_variants + self._other_variants:
+            if var.endswith(("_rev", "_sources")) and spec.variants[var].value != "none":
+                overrides.add(var)
+        for ref_var, ref_cfg in self._resource_cfg.items():
+            if spec.variants[ref_var].value != "none":
+                overrides.add(ref_cfg["sources_var"])
+        return overrides
+
+
+    def _prebuild_path(self):
+        """
+        Return the path of the prebuild in cache_dir matching the resolved
+        configuration, or None if cache_dir is not set or the spec sets
+        prebuild explicitly. The key has the sources and revisions of the
+        model in place of those that the spec overrides, so that these
+        builds find the prebuild of the model configuration.
+        """
+        spec = self.spec
+        config_env = self._config_env
+        cache_dir = spec.variants["cache_dir"].value
+        if cache_dir == "none" or config_env.get("prebuild", "") != "":
+            return None
+        overrides = self._source_overrides()
+        settings = []
+        for key in sorted(config_env):
+            if key == "prebuild":
+                continue
+            value = config_env[key]
+            if key in overrides:
+                value = self._model_env.get(key, "")
+                if key in self._rev_variants and value == "":
+                    # The default revision, as in setup_build_environment()
+                    value = f"um{spec.version}"
+            settings.append(f"{key}={value}")
+        deps = sorted(dep.dag_hash() for dep in spec.dependencies())
+        key = " ".join(
+            [spec.name, str(spec.version), str(spec.compiler), str(spec.architecture)]
+            + settings + deps)
+        key_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return join_path(cache_dir, "prebuild", key_hash)
+
+
+    def _make_steps(self, steps, jobs, prebuilds):
+        """
+        Run a concurrent FCM make command for each of steps, sharing jobs
+        between them. Each command inherits from the prebuild given for
+        its step in prebuilds, and disables all other compile steps.
+        """
+        config_env = self._config_env
+        other_steps = {
+            key: "" for key in config_env if key.startswith("compile_")}
+        step_jobs = max(1, jobs // len(steps))
+
+        def make_step(step):
+            step_env = dict(other_steps)
+            step_env[f"compile_{step}"] = config_env[f"compile_{step}"]
+            step_env["prebuild"] = prebuilds[step]
+            tty.info(f"Building {step} using {step_jobs} jobs")
+            self._fcm_make(self._build_dir(step), step_jobs, **step_env)
+
+        with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            futures = [executor.submit(make_step, step) for step in steps]
+            for future in futures:
+                future.result()
+
+
+    def _make(self, steps, jobs):
+        """
+        Build the executables from scratch, running the concurrent steps
+        in parallel after a shared extract.
+        """
+        if len(steps) < 2:
+            self._fcm_make(self._build_dir(), jobs)
+            return
+
+        # Extract the sources (and build any other requested steps) once.
+        self._fcm_make(
+            self._build_dir(),
+            jobs,
+            **{f"compile_{step}": "" for step in steps})
+
+        # Each concurrent step inherits the extract from the build directory.
+        self._make_steps(
+            steps, jobs, {step: self._build_dir() for step in steps})
+
+
+    def _make_from_prebuild(self, prebuild_path, steps, jobs):
+        """
+        Build the executables incrementally, inheriting from the
+        prebuild in prebuild_path.
+        """
+        prebuild_dirs = {
+            step: join_path(prebuild_path, f"spack-build-{step}")
+            for step in steps}
+        if len(steps) >= 2 and all(map(os.path.isdir, prebuild_dirs.values())):
+            # Each step inherits its own extract, preprocess and build,
+            # so the shared extract is not needed.
+            self._make_steps(steps, jobs, prebuild_dirs)
+        else:
+            self._fcm_make(
+                self._build_dir(),
+                jobs,
+                prebuild=join_path(prebuild_path, "spack-build"))
+
+
+    def build(self, spec, prefix):
+        """
+        Use FCM to build the executables.
+        """
+        # make_jobs follows the -j option and the build_jobs configuration,
+        # and is limited to the CPUs available to the build process.
+        jobs = make_jobs
+        config_env = self._config_env
+        self._fcm_config_file = self._make_config_file()
+        steps = [
+            step for step in self._concurrent_steps
+            if config_env.get(f"compile_{step}", "") != ""]
+
+        prebuild_path = self._prebuild_path()
+        if prebuild_path is None:
+            self._make(steps, jobs)
+            return
+
+        if os.path.exists(join_path(prebuild_path, self._prebuild_complete)):
+            tty.info(f"Using the prebuild {prebuild_path}")
+            self._make_from_prebuild(prebuild_path, steps, jobs)
+            return
+
+        # Only a build of the model's own sources publishes a prebuild.
+        # Creating the directory claims it, so concurrent builds with
+        # the same configuration do not build into the same directory.
+        publish = not self._source_overrides()
+        if publish:
+            mkdirp(os.path.dirname(prebuild_path))
+            try:
+                os.mkdir(prebuild_path)
+            except FileExistsError:
+                publish = False
+        if not publish:
+            self._make(steps, jobs)
+            return
+
+        tty.info(f"Publishing the prebuild {prebuild_path}")
+        self._build_root = prebuild_path
+        try:
+            self._make(steps, jobs)
+        except BaseException:
+            # Release the claim, so that a later build can publish the prebuild.
+            tty.warn(f"Removing the incomplete prebuild {prebuild_path}")
+            shutil.rmtree(prebuild_path, ignore_errors=True)
+            raise
+        touch(join_path(prebuild_path, self._prebuild_complete))
 
 
     def install(self, spec, prefix):
@@ -442,8 +701,11 @@ class Um(Package):
         https://code.metoffice.gov.uk/trac/roses-u/browser/b/y/3/9/5/trunk/meta/rose-meta.conf
         """
         for um_exe in ["atmos", "recon"]:
+            build_dir = self._build_dir(um_exe)
+            if not os.path.isdir(build_dir):
+                build_dir = self._build_dir()
             bin_dir = join_path(f"build-{um_exe}", "bin")
-            build_bin_dir = join_path(self._build_dir(), bin_dir)
+            build_bin_dir = join_path(build_dir, bin_dir)
             install_bin_dir = join_path(prefix, bin_dir)
             mkdirp(install_bin_dir)
             install_tree(build_bin_dir, install_bin_dir)
@@ -468,14 +730,68 @@ class Um(Package):
 
         git = spack.util.git.git()
 
-        # Attempt to check out branch to dir
+        # Fetch from the local mirror of url, if there is one.
+        mirror_path = self._git_mirror(url)
+        source = url if mirror_path is None else f"file://{mirror_path}"
+
+        git("init", "--quiet", dst_dir)
+        with working_dir(dst_dir):
+            git("remote", "add", "origin", source)
+            # Branches, tags and full commit hashes can all be fetched shallowly.
+            try:
+                tty.msg(f"Attempting to fetch {ref} shallowly")
+                git("fetch", "--depth", "1", "origin", ref)
+                git("checkout", "--quiet", "FETCH_HEAD")
+            except ProcessError:
+                tty.warn(f"ref '{ref}' may be an abbreviated commit, retrying.")
+                git("fetch", "--tags", "origin",
+                    "+refs/heads/*:refs/remotes/origin/*")
+                git("checkout", "--quiet", ref)
+
+        tty.msg(f"{ref} checked out from {source} to {dst_dir}")
+
+
+    def _git_mirror(self, url):
+        """
+        Return the path of a bare mirror of url in cache_dir, creating it
+        or fetching into it as needed. Return None if cache_dir is not set
+        or the mirror cannot be created.
+        """
+        cache_dir = self.spec.variants["cache_dir"].value
+        if cache_dir == "none":
+            return None
+
+        # For example, https://github.com/ACCESS-NRI/UM.git is mirrored
+        # in cache_dir/git/ACCESS-NRI/UM.git
+        owner, name = url.rstrip("/").split("/")[-2:]
+        mirror_path = join_path(cache_dir, "git", owner, name)
+
+        git = spack.util.git.git()
+        if os.path.isdir(mirror_path):
+            try:
+                tty.msg(f"Updating the mirror {mirror_path}")
+                git("--git-dir", mirror_path, "fetch", "--prune", "origin")
+            except ProcessError:
+                tty.warn(f"Could not update the mirror {mirror_path}.")
+            return mirror_path
+
+        # Clone to a private directory, then rename, so that concurrent
+        # builds never see a partial mirror.
+        mkdirp(os.path.dirname(mirror_path))
+        clone_path = f"{mirror_path}.{os.getpid()}"
         try:
-            tty.msg(f"Attempting to checkout branch {ref}")
-            git("clone", "--depth", "1", "--branch", ref, url, dst_dir)
+            tty.msg(f"Creating the mirror {mirror_path}")
+            git("clone", "--quiet", "--mirror", url, clone_path)
+            # Allow shallow fetches of any commit, as GitHub does.
+            git("--git-dir", clone_path,
+                "config", "uploadpack.allowAnySHA1InWant", "true")
         except ProcessError:
-            tty.warn(f"ref '{ref}' may be a commit/tag, retrying.")
-            git("clone", url, dst_dir)
-            with working_dir(dst_dir):
-                git("checkout", ref)
-
-        tty.msg(f"{ref} checked out from {url} to {dst_dir}")
+            tty.warn(f"Could not create the mirror {mirror_path}.")
+            shutil.rmtree(clone_path, ignore_errors=True)
+            return None
+        try:
+            os.rename(clone_path, mirror_path)
+        except OSError:
+            # Another build has created the mirror in the meantime.
+            shutil.rmtree(clone_path, ignore_errors=True)
+        return mirror_path
@@ -7,8 +7,16 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import filecmp
+import hashlib
+import os
+import shutil
 
+from llnl.util.lock import Lock
+
+from spack.version.version_types import GitVersion
 from spack.package import *
+import llnl.util.tty as tty
 
 class Um7(Package):
     """
@@ -40,6 +48,14 @@ class Um7(Package):
     )
     variant("optim", default="high", description="Optimization level",
             values=("high", "debug"), multi=False)
+    variant(
+        "cache_dir",
+        default="none",
+        values="*",
+        multi=False,
+        description="Directory for a persistent FCM build tree, "
+                    "reused by incremental (~full) builds"
+    )
 
     with when("@access-esm1.6"):
         depends_on("cable library='access-esm1.6'", type=("build", "link"))
@@ -83,6 +99,80 @@ class Um7(Package):
             return "um_hg3.exe"
 
 
+    def _build_cache_key(self):
+        """
+        Return the key of the persistent build tree. The key depends on
+        the spec but not on the source revision, so that successive builds
+        of a branch reuse the same tree.
+        """
+        spec = self.spec
+        version = spec.version
+        if isinstance(version, GitVersion):
+            version = version.ref_version
+        variants = [
+            f"{name}={variant.value}"
+            for name, variant in sorted(spec.variants.items())
+            if name not in ("cache_dir", "full")]
+        deps = sorted(dep.dag_hash() for dep in spec.dependencies())
+        key = " ".join(
+            [spec.name, str(version), str(spec.compiler), str(spec.architecture)]
+            + variants + deps)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+    def _build_root(self):
+        """
+        Return the directory containing the FCM build tree: either the
+        persistent build tree in cache_dir or the stage.
+        """
+        cache_dir = self.spec.variants["cache_dir"].value
+        if cache_dir == "none":
+            return self.stage.source_path
+        return join_path(cache_dir, f"um7-{self._build_cache_key()}")
+
+
+    # The list of the source files copied into the persistent build tree.
+    _sync_manifest = ".spack-sync-manifest"
+
+
+    def _sync_build_root(self):
+        """
+        Copy the source tree into the persistent build tree, copying only
+        files whose contents differ so that the timestamps of unchanged
+        sources are preserved and FCM only rebuilds what has changed.
+        Changed files get the current time, so they are newer than their
+        objects, and files removed from the source are removed from the tree.
+        The files written by FCM are not in the manifest, and are kept.
+        """
+        src_root = self.stage.source_path
+        dst_root = self._build_root()
+        tty.info(f"Using the persistent build tree {dst_root}")
+        synced = set()
+        for src_dir, dirs, files in os.walk(src_root):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            rel_dir = os.path.relpath(src_dir, src_root)
+            dst_dir = join_path(dst_root, rel_dir)
+            mkdirp(dst_dir)
+            for name in files:
+                src = join_path(src_dir, name)
+                dst = join_path(dst_dir, name)
+                synced.add(os.path.normpath(join_path(rel_dir, name)))
+                if not os.path.isfile(dst) or not filecmp.cmp(src, dst, shallow=False):
+                    shutil.copy(src, dst)
+                    os.utime(dst)
+
+        manifest = join_path(dst_root, self._sync_manifest)
+        if os.path.isfile(manifest):
+            with open(manifest) as manifest_file:
+                previous = set(manifest_file.read().splitlines())
+            for rel_path in sorted(previous - synced):
+                tty.info(f"Removing {rel_path}, which is no longer in the source")
+                if os.path.lexists(join_path(dst_root, rel_path)):
+                    os.remove(join_path(dst_root, rel_path))
+        with open(manifest, "w") as manifest_file:
+            manifest_file.write("\n".join(sorted(synced)) + "\n")
+
+
     def _get_linker_args(self, spec, name):
         """
         The reason for the explicit -rpath is:
@@ -258,11 +348,38 @@ tool::ldflags                                      {FOBLANK} -g -traceback {FDEB
         """
         Use FCM to build the executable.
         """
+        build_root = self._build_root()
+        if build_root == self.stage.source_path:
+            self._fcm_build(build_root)
+            return
+
+        # Builds of the same spec share the persistent build tree, so they
+        # take turns to sync, build and copy the executable out of it.
+        mkdirp(build_root)
+        lock = Lock(f"{build_root}.lock")
+        lock.acquire_write()
+        try:
+            self._sync_build_root()
+            self._fcm_build(build_root)
+            um_exe = self._exe_name(spec.variants["optim"].value)
+            bin_dir = join_path(self.stage.source_path, self._bld_path, "bin")
+            mkdirp(bin_dir)
+            install(join_path(build_root, self._bld_path, "bin", um_exe), bin_dir)
+        finally:
+            lock.release_write()
+
+
+    def _fcm_build(self, build_root):
+        """
+        Run the FCM build in build_root.
+        """
         fcm = which("fcm")
-        if spec.satisfies("+full"):
-            fcm("build", "-f", "-j", "4", self._bld_cfg_path)
-        else:
-            fcm("build", "-j", "4", self._bld_cfg_path)
+        jobs = str(make_jobs)
+        with working_dir(build_root):
+            if self.spec.satisfies("+full"):
+                fcm("build", "-f", "-j", jobs, self._bld_cfg_path)
+            else:
+                fcm("build", "-j", jobs, self._bld_cfg_path)
 
 
     def install(self, spec, prefix):
@@ -273,5 +390,5 @@ tool::ldflags                                      {FOBLANK} -g -traceback {FDEB
         um_exe = self._exe_name(spec.variants["optim"].value)
         mkdirp(prefix.bin)
         install(
-            join_path(self._bld_path, "bin", um_exe),
+            join_path(self.stage.source_path, self._bld_path, "bin", um_exe),
             join_path(prefix.bin, um_exe))